@@ -1,22 +1,25 @@
 #!/user/bin/env python3
 
 """
-Connect to OpenOCD via Telnet
+Connect to OpenOCD via Telnet or TCL RPC
 """
 
+import sys
+import socket
 import telnetlib
+import threading
+from openocd_common import _parse_mdw
 
 
 class OpenOCDTelnet:
     def __init__(self):
         self.is_opened = False
-        self.is_busy = False
+        self.lock = threading.Lock()
         self.__target = ""
 
     def open(self, host="localhost", port=4444, timeout=1):
         self.telnet = telnetlib.Telnet(host, port)
         self.is_opened = True
-        self.is_busy = False
         self.timeout = timeout
         self.read_data()
         self.get_target_name()
@@ -46,14 +49,23 @@ class OpenOCDTelnet:
         else:
             raise RuntimeError("Can't write data - OpenOCD telnet is not opened!")
 
+    def write_cmds(self, cmds):
+        self.write_data("\r\n".join(cmds))
+
     def send_cmd(self, cmd):
-        while self.is_busy:
-            pass
-        self.is_busy = True
-        self.write_data(cmd)
-        retval = self.read_data().strip().split('\r\n')[-1].strip()
-        self.is_busy = False
-        return retval
+        retval = self.exec_cmd(cmd).strip().splitlines()
+        return retval[-1].strip() if retval else ""
+
+    def exec_cmd(self, cmd):
+        # whole command output, send_cmd takes the last line of it
+        return self.exec_cmds([cmd])[0]
+
+    def exec_cmds(self, cmds):
+        # all commands are written at once and replies are read back in the same
+        # order, so the whole batch costs about one round trip
+        with self.lock:
+            self.write_cmds(cmds)
+            return [self.read_data() for cmd in cmds]
 
     def get_target_name(self):
         self.__target = self.send_cmd("target current")
@@ -68,12 +80,81 @@ class OpenOCDTelnet:
     def read_mem(self, addr):
         return int(self.send_cmd("mdw 0x%08x" % addr).split(":")[-1].strip(), 16)
 
+    def read_mem_block(self, addr, count):
+        # count 32-bit words with a single mdw
+        return _parse_mdw(self.exec_cmd("mdw 0x%08x %d" % (addr, count)), addr, count)
+
+    def read_mem_blocks(self, blocks):
+        # list of (addr, count) blocks read with one pipelined batch
+        outputs = self.exec_cmds(["mdw 0x%08x %d" % (addr, count) for addr, count in blocks])
+        return [_parse_mdw(output, addr, count) for output, (addr, count) in zip(outputs, blocks)]
+
     def write_mem(self, addr, val):
         self.send_cmd("mww 0x%08x 0x%08x" % (addr, val))
 
+    def write_mems(self, writes):
+        # list of (addr, val) written with one pipelined batch
+        self.exec_cmds(["mww 0x%08x 0x%08x" % (addr, val) for addr, val in writes])
+
+
+class OpenOCDTclRpc(OpenOCDTelnet):
+    """The same API as OpenOCDTelnet over OpenOCD TCL RPC port.
+
+    Every command and every reply is terminated with 0x1a, so a reply is read
+    exactly once without waiting for a prompt or a timeout. Commands are run
+    with capture to get the same text output as telnet gives.
+    """
+    TERMINATOR = b"\x1a"
+
+    def open(self, host="localhost", port=6666, timeout=1):
+        self.socket = socket.create_connection((host, port), timeout)
+        self.socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.is_opened = True
+        self.timeout = timeout
+        self.__buffer = b""
+        self.get_target_name()
+
+    def close(self):
+        self.is_opened = False
+        self.socket.close()
+
+    def check_alive(self):
+        # one round trip is enough - reply either comes framed or not at all
+        try:
+            self.send_cmd("")
+            return True
+        except (RuntimeError, OSError):
+            return False
+
+    def read_data(self):
+        if not self.is_opened:
+            raise RuntimeError("Can't read data - OpenOCD TCL RPC is not opened!")
+        while self.TERMINATOR not in self.__buffer:
+            try:
+                chunk = self.socket.recv(65536)
+            except socket.timeout:
+                # late reply would be taken for the next command one, so connection is dropped
+                self.close()
+                raise RuntimeError("Can't read data - OpenOCD TCL RPC reply timeout!")
+            if not chunk:
+                self.close()
+                raise RuntimeError("Can't read data - OpenOCD TCL RPC connection closed!")
+            self.__buffer += chunk
+        reply, self.__buffer = self.__buffer.split(self.TERMINATOR, 1)
+        return reply.decode(errors="replace")
+
+    def write_data(self, data):
+        if self.is_opened:
+            self.socket.sendall(data.encode() + self.TERMINATOR)
+        else:
+            raise RuntimeError("Can't write data - OpenOCD TCL RPC is not opened!")
+
+    def write_cmds(self, cmds):
+        self.write_data(self.TERMINATOR.decode().join("capture {%s}" % cmd for cmd in cmds))
+
 
 if __name__ == "__main__":
-    openocd_tn = OpenOCDTelnet()
+    openocd_tn = OpenOCDTclRpc() if "--rpc" in sys.argv else OpenOCDTelnet()
     openocd_tn.open()
     if (openocd_tn.check_alive()):
         print(openocd_tn.get_target_name())
@@ -0,0 +1,292 @@
+#!/user/bin/env python3
+
+"""
+Connect to OpenOCD via Telnet or TCL RPC with asyncio streams
+
+Many connections are driven by one event loop, OpenOCDLoop runs it in a
+dedicated thread for callers which are not asyncio code themselves.
+"""
+
+import re
+import sys
+import asyncio
+import threading
+from openocd_common import OpenOCDTimeout, _parse_mdw
+
+
+# telnet option negotiation (IAC WILL/WONT/DO/DONT option and IAC SB ... IAC SE)
+_TELNET_IAC = re.compile(rb"\xff[\xfb-\xfe].|\xff\xfa.*?\xff\xf0|\xff[\xf0-\xfa]", re.DOTALL)
+
+# global TCL array with halt count of every target
+_HALTS = "openocd_svd_halts"
+# read-modify-write of one word on the target side, returns the written value;
+# OpenOCD older than 0.12 has no read_memory, mem2array is used there
+_RMW = "openocd_svd_rmw"
+_RMW_PROC = ("proc %s {addr mask val} {"
+             "if {[llength [info commands read_memory]]} {set old [lindex [read_memory $addr 32 1] 0]} "
+             "else {mem2array _old 32 $addr 1; set old $_old(0)}; "
+             "set new [expr {($old & ~$mask) | ($val & $mask)}]; "
+             "mww $addr $new; "
+             "format 0x%%08x $new}" % _RMW)
+# mask of a write of the whole word
+FULL_MASK = 0xffffffff
+# values of target curstate
+_TARGET_STATES = ("unknown", "running", "halted", "reset", "debug-running")
+
+
+class AsyncOpenOCDTelnet:
+    SEPARATOR = b"\r\n\r"
+
+    def __init__(self):
+        self.is_opened = False
+        self.lock = asyncio.Lock()
+        self.timeout = 1
+        self.__target = ""
+        self.__buffer = b""
+
+    async def open(self, host="localhost", port=4444, timeout=1):
+        try:
+            self.reader, self.writer = await asyncio.wait_for(asyncio.open_connection(host, port), timeout)
+        except asyncio.TimeoutError:
+            # not OSError before Python 3.11
+            raise OpenOCDTimeout("Can't open connection - OpenOCD connect timeout!")
+        self.is_opened = True
+        self.timeout = timeout
+        self.__buffer = b""
+        await self.read_banner()
+        await self.get_target_name()
+
+    async def close(self):
+        if self.is_opened:
+            self.is_opened = False
+            self.writer.close()
+            try:
+                await self.writer.wait_closed()
+            except OSError:
+                pass
+
+    async def check_alive(self):
+        try:
+            await self.send_cmd("")
+            return True
+        except (RuntimeError, OSError):
+            return False
+
+    async def read_banner(self):
+        await self.read_data()
+
+    async def read_data(self):
+        if not self.is_opened:
+            raise RuntimeError("Can't read data - OpenOCD is not opened!")
+        while self.SEPARATOR not in self.__buffer:
+            try:
+                chunk = await asyncio.wait_for(self.reader.read(65536), self.timeout)
+            except asyncio.TimeoutError:
+                # late reply would be taken for the next command one, so connection is dropped
+                await self.close()
+                raise OpenOCDTimeout("Can't read data - OpenOCD reply timeout!")
+            if not chunk:
+                await self.close()
+                raise RuntimeError("Can't read data - OpenOCD connection closed!")
+            self.__buffer += self.filter_data(chunk)
+        reply, self.__buffer = self.__buffer.split(self.SEPARATOR, 1)
+        return reply.decode(errors="replace")
+
+    def filter_data(self, chunk):
+        # options are not negotiated - OpenOCD works with defaults
+        return _TELNET_IAC.sub(b"", chunk)
+
+    def write_cmds(self, cmds):
+        if not self.is_opened:
+            raise RuntimeError("Can't write data - OpenOCD is not opened!")
+        self.writer.write("".join("%s\r\n" % cmd for cmd in cmds).encode())
+
+    async def send_cmd(self, cmd, timeout=None):
+        retval = (await self.exec_cmd(cmd, timeout)).strip().splitlines()
+        return retval[-1].strip() if retval else ""
+
+    async def exec_cmd(self, cmd, timeout=None):
+        return (await self.exec_cmds([cmd], timeout))[0]
+
+    async def exec_cmds(self, cmds, timeout=None):
+        # pipelined like OpenOCDTelnet.exec_cmds, timeout limits the wait for the
+        # connection; cancellation is the usual task cancellation
+        await self.acquire(timeout)
+        try:
+            self.write_cmds(cmds)
+            await self.writer.drain()
+            retval = []
+            for cmd in cmds:
+                retval += [await self.read_data()]
+        except asyncio.CancelledError:
+            # replies of written commands can't be matched anymore
+            await self.close()
+            raise
+        finally:
+            self.lock.release()
+        return retval
+
+    async def acquire(self, timeout=None):
+        """Wait for the connection to be free for up to timeout seconds (forever
+        if None). The lock is never left taken by a wait which timed out or was
+        cancelled just as the lock was granted."""
+        acquire = asyncio.ensure_future(self.lock.acquire())
+        try:
+            await asyncio.wait([acquire], timeout=timeout)
+        except asyncio.CancelledError:
+            self.__drop_acquire(acquire)
+            raise
+        if not acquire.done():
+            self.__drop_acquire(acquire)
+            raise OpenOCDTimeout("OpenOCD is busy for more than %.3f s" % timeout)
+
+    def __drop_acquire(self, acquire):
+        if not acquire.done():
+            # Lock.acquire cancelled before it returns does not take the lock
+            acquire.cancel()
+        elif not acquire.cancelled() and acquire.exception() is None:
+            self.lock.release()
+
+    async def get_target_name(self):
+        self.__target = await self.send_cmd("target current")
+        return self.__target
+
+    async def get_target_names(self):
+        return (await self.send_cmd("target names")).split()
+
+    async def select_target(self, name):
+        # current target is kept per connection
+        await self.send_cmd("targets %s" % name)
+        return await self.get_target_name()
+
+    async def get_target_state(self):
+        return await self.send_cmd("%s curstate" % self.__target)
+
+    async def get_target_status(self):
+        """Return target state, PC (None unless halted) and halt count with one command"""
+        return self.__parse_status(await self.send_cmd(self.__status_cmd()))
+
+    async def read_status_blocks(self, blocks, timeout=None):
+        """Return target status (see get_target_status) and words of (addr, count)
+        blocks read right after it, all with one batch"""
+        outputs = await self.exec_cmds([self.__status_cmd()] +
+                                       ["mdw 0x%08x %d" % (addr, count) for addr, count in blocks], timeout)
+        status = outputs[0].strip().splitlines()
+        return (self.__parse_status(status[-1].strip() if status else ""),
+                [_parse_mdw(output, addr, count) for output, (addr, count) in zip(outputs[1:], blocks)])
+
+    def __status_cmd(self):
+        target = self.__target
+        return (("set _state [%s curstate]; " % target) +
+                ("set _halts [expr {[info exists ::%s(%s)] ? $::%s(%s) : 0}]; " % (_HALTS, target, _HALTS, target)) +
+                "if {$_state eq \"halted\"} {concat $_state $_halts [capture {reg pc}]} "
+                "else {concat $_state $_halts}")
+
+    def __parse_status(self, reply):
+        state, halts, pc = (reply.split(" ", 2) + ["", ""])[:3]
+        if state not in _TARGET_STATES or not halts.isdigit():
+            raise RuntimeError("Can't get target status - %s" % reply)
+        return state, int(pc.split(":")[-1].strip(), 16) if pc else None, int(halts)
+
+    async def count_halts(self):
+        # halted event handler counts halts, so the status tells whether the target
+        # has run between two queries even if it stopped at the same PC; handler
+        # already set by OpenOCD config is kept
+        target = self.__target
+        await self.send_cmd(("set _event [%s cget -event halted]; " % target) +
+                            ("if {[string first %s $_event] < 0} " % _HALTS) +
+                            ("{%s configure -event halted \"$_event; incr ::%s(%s)\"}" % (target, _HALTS, target)))
+
+    async def define_procs(self):
+        await self.send_cmd(_RMW_PROC)
+
+    async def get_target_pc(self):
+        return int((await self.send_cmd("reg pc")).split(":")[-1].strip(), 16)
+
+    async def read_mem(self, addr):
+        return int((await self.send_cmd("mdw 0x%08x" % addr)).split(":")[-1].strip(), 16)
+
+    async def read_mem_block(self, addr, count):
+        return _parse_mdw(await self.exec_cmd("mdw 0x%08x %d" % (addr, count)), addr, count)
+
+    async def read_mem_blocks(self, blocks, timeout=None):
+        outputs = await self.exec_cmds(["mdw 0x%08x %d" % (addr, count) for addr, count in blocks], timeout)
+        return [_parse_mdw(output, addr, count) for output, (addr, count) in zip(outputs, blocks)]
+
+    async def write_mem(self, addr, val):
+        await self.send_cmd("mww 0x%08x 0x%08x" % (addr, val))
+
+    async def write_mems(self, writes, timeout=None):
+        await self.exec_cmds(["mww 0x%08x 0x%08x" % (addr, val) for addr, val in writes], timeout)
+
+    async def write_masked_mems(self, writes, timeout=None):
+        """Write (addr, val, mask) words in the given order with one batch. Words
+        with some bits of mask clear are modified on the target side, for them
+        the new value is returned, None for the others. Needs define_procs()."""
+        outputs = await self.exec_cmds([("mww 0x%08x 0x%08x" % (addr, val)) if mask == FULL_MASK else
+                                        ("%s 0x%08x 0x%08x 0x%08x" % (_RMW, addr, mask, val & mask))
+                                        for addr, val, mask in writes], timeout)
+        values = []
+        for output, (addr, val, mask) in zip(outputs, writes):
+            if mask == FULL_MASK:
+                values += [None]
+                continue
+            lines = output.strip().splitlines()
+            try:
+                values += [int(lines[-1].strip(), 16)]
+            except (IndexError, ValueError):
+                raise RuntimeError("Can't modify word at 0x%08x - %s" % (addr, output.strip()))
+        return values
+
+
+class AsyncOpenOCDTclRpc(AsyncOpenOCDTelnet):
+    """The same API as AsyncOpenOCDTelnet over OpenOCD TCL RPC port"""
+    SEPARATOR = b"\x1a"
+
+    async def open(self, host="localhost", port=6666, timeout=1):
+        await AsyncOpenOCDTelnet.open(self, host, port, timeout)
+
+    async def read_banner(self):
+        pass
+
+    def filter_data(self, chunk):
+        return chunk
+
+    def write_cmds(self, cmds):
+        if not self.is_opened:
+            raise RuntimeError("Can't write data - OpenOCD is not opened!")
+        self.writer.write(b"".join(("capture {%s}" % cmd).encode() + self.SEPARATOR for cmd in cmds))
+
+
+class OpenOCDLoop:
+    """Event loop in a dedicated thread, coroutines are submitted from any thread"""
+
+    def __init__(self):
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.loop.run_forever, name="OpenOCDLoop", daemon=True)
+        self.thread.start()
+
+    def submit(self, coro):
+        # concurrent.futures.Future with the coroutine result
+        return asyncio.run_coroutine_threadsafe(coro, self.loop)
+
+    def run(self, coro, timeout=None):
+        return self.submit(coro).result(timeout)
+
+    def stop(self):
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
+        self.loop.close()
+
+
+if __name__ == "__main__":
+    async def main():
+        openocd = AsyncOpenOCDTclRpc() if "--rpc" in sys.argv else AsyncOpenOCDTelnet()
+        await openocd.open()
+        if await openocd.check_alive():
+            print(await openocd.get_target_name())
+            print(await openocd.get_target_state())
+            print("0x%08X" % await openocd.read_mem(0x00000000))
+        await openocd.close()
+
+    asyncio.run(main())
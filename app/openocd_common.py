@@ -0,0 +1,34 @@
+#!/user/bin/env python3
+
+"""
+Exceptions and reply parsing shared by OpenOCD clients
+
+Nothing here depends on a transport, so the asyncio client works on Python
+versions without telnetlib.
+"""
+
+import re
+
+
+# address and words of one mdw output line
+_MDW_LINE = re.compile(r"^(?:> )?0x([0-9a-fA-F]+):((?:\s+[0-9a-fA-F]+)+)\s*$")
+
+
+class OpenOCDTimeout(RuntimeError):
+    pass
+
+
+def _parse_mdw(output, addr, count):
+    # reply is parsed in one pass, every line is address and up to 8 words; line
+    # address must follow the words before it, so a reply of another command
+    # is not taken for the data
+    words = []
+    for line in output.splitlines():
+        m = _MDW_LINE.match(line.strip())
+        if m:
+            if int(m.group(1), 16) != addr + 4 * len(words):
+                raise RuntimeError("Can't read %d words at 0x%08x - got line at 0x%s" % (count, addr, m.group(1)))
+            words += [int(word, 16) for word in m.group(2).split()]
+    if len(words) != count:
+        raise RuntimeError("Can't read %d words at 0x%08x - got %d" % (count, addr, len(words)))
+    return words
@@ -0,0 +1,217 @@
+#!/user/bin/env python3
+
+"""
+Pool of OpenOCD connections keyed by host:port and target name
+
+Every target gets its own connection with the target made current for it,
+so commands to different targets (cores of one OpenOCD or several boards)
+run in parallel on one event loop. Memory reads of every target go through
+its shadow cache. All methods but key() and keys() are coroutines to be run
+on that loop (see OpenOCDLoop).
+"""
+
+import asyncio
+from openocd_async import AsyncOpenOCDTelnet, AsyncOpenOCDTclRpc, FULL_MASK
+from openocd_shadow import ShadowCache
+
+
+# pool coroutines which call() runs instead of client methods
+_POOL_METHODS = ("status", "read_blocks", "modify_words")
+
+
+class OpenOCDPool:
+    def __init__(self, timeout=1):
+        self.timeout = timeout
+        self.clients = {}
+        self.addresses = {}
+        self.reopening = {}
+        self.shadows = {}
+
+    @staticmethod
+    def key(host, port, target):
+        return "%s:%d %s" % (host, port, target)
+
+    def keys(self):
+        # clients are added on the loop thread, copy is atomic for other threads
+        return sorted(self.clients.copy())
+
+    # -- Coroutines --
+    async def connect_async(self, host, port, rpc):
+        client_class = AsyncOpenOCDTclRpc if rpc else AsyncOpenOCDTelnet
+        first = client_class()
+        await first.open(host, port, self.timeout)
+        targets = await first.get_target_names()
+        if not targets:
+            targets = [await first.get_target_name()]
+        clients = [first] + [client_class() for target in targets[1:]]
+        await asyncio.gather(*[client.open(host, port, self.timeout) for client in clients[1:]])
+        for client, target in zip(clients, targets):
+            key = self.key(host, port, target)
+            if key in self.clients:
+                await self.close_async(key)
+            await self.setup(client, target)
+            self.clients[key] = client
+            self.addresses[key] = (host, port, target)
+            self.reopening[key] = asyncio.Lock()
+            self.shadows[key] = ShadowCache()
+        return [self.key(host, port, target) for target in targets]
+
+    async def call(self, key, method, *args, retry=False):
+        """Call client method for the target, closed connection is reopened
+        first. Call which lost the connection is repeated only with retry - the
+        batch may have partly run, so writes and reads with side effects must
+        not run twice; the connection is reopened by the next call then."""
+        if method in _POOL_METHODS:
+            return await getattr(self, method)(key, *args)
+        client = self.clients[key]
+        if not client.is_opened:
+            await self.reopen(key)
+        try:
+            return await getattr(client, method)(*args)
+        except OSError:
+            await client.close()
+            if not retry:
+                raise
+        except RuntimeError:
+            # OpenOCD answered, only a lost connection is worth reopening
+            if client.is_opened or not retry:
+                raise
+        await self.reopen(key)
+        return await getattr(client, method)(*args)
+
+    async def call_many(self, calls):
+        return await asyncio.gather(*[self.call(key, method, *args) for key, method, args in calls],
+                                    return_exceptions=True)
+
+    async def status_many_async(self, keys):
+        return await self.call_many([(key, "status", ()) for key in keys])
+
+    async def read_many_async(self, reads, use_cache=True):
+        """Read (key, blocks, volatile) at once, blocks are (addr, count) and
+        volatile tells for every block if it is never taken from the shadow cache
+        nor read again after a lost connection. (words per block, indexes of
+        blocks read from the target, round trips) or exception is returned per
+        read, in the order of reads."""
+        return await self.call_many([(key, "read_blocks", (blocks, volatile, use_cache))
+                                     for key, blocks, volatile in reads])
+
+    async def write_many_async(self, writes):
+        """Write (key, [(addr, val, mask), ...]) at once, words of a target are
+        sent in the given order, ones with some bits of mask clear are modified
+        on the target side. List of (addr, new value) of modified words or
+        exception per key is returned."""
+        return await self.call_many([(key, "modify_words", (words,)) for key, words in writes])
+
+    async def status(self, key):
+        try:
+            status = await self.call(key, "get_target_status", retry=True)
+        except (RuntimeError, OSError):
+            self.shadows[key].invalidate()
+            raise
+        self.shadows[key].update_status(*status)
+        return status
+
+    async def read_blocks(self, key, blocks, volatile, use_cache):
+        # the target may have been resumed since the last poll, so cached words are
+        # used only if target status queried in front of the reads is unchanged
+        shadow = self.shadows[key]
+        cached = [use_cache and not block_volatile for block_volatile in volatile]
+        result = [shadow.get(addr, count) if use else None for (addr, count), use in zip(blocks, cached)]
+        missing = [num for num, words in enumerate(result) if words is None]
+        retry = not any(volatile[num] for num in missing)
+        round_trips = 0
+        if any(cached):
+            generation = shadow.generation
+            status, words = await self.call(key, "read_status_blocks", [blocks[num] for num in missing], retry=retry)
+            round_trips += 1
+            shadow.update_status(*status)
+            read = dict(zip(missing, words))
+            if shadow.generation != generation:
+                # cached words are older than the status, they are read again
+                stale = [num for num in range(len(blocks)) if num not in read]
+                if stale:
+                    read.update(zip(stale, await self.call(key, "read_mem_blocks", [blocks[num] for num in stale],
+                                                           retry=True)))
+                    round_trips += 1
+        elif missing:
+            read = dict(zip(missing, await self.call(key, "read_mem_blocks", [blocks[num] for num in missing],
+                                                     retry=retry)))
+            round_trips += 1
+        else:
+            read = {}
+        generation = shadow.generation
+        for num, block_words in read.items():
+            result[num] = block_words
+            if cached[num]:
+                shadow.put(blocks[num][0], block_words, generation)
+        misses = len([num for num in read if cached[num]])
+        shadow.hits += sum(cached) - misses
+        shadow.misses += misses
+        return result, sorted(read), round_trips
+
+    async def modify_words(self, key, writes):
+        # one batch in the order of writes; the words are dropped again for reads
+        # finished meanwhile
+        for addr, val, mask in writes:
+            self.shadows[key].forget(addr)
+        try:
+            values = await self.call(key, "write_masked_mems", writes)
+        finally:
+            for addr, val, mask in writes:
+                self.shadows[key].forget(addr)
+        return [(addr, value) for (addr, val, mask), value in zip(writes, values) if value is not None]
+
+    async def reopen(self, key):
+        # callers waiting for the same connection reopen it only once
+        async with self.reopening[key]:
+            client = self.clients[key]
+            if not client.is_opened:
+                self.shadows[key].invalidate()
+                host, port, target = self.addresses[key]
+                await client.open(host, port, self.timeout)
+                await self.setup(client, target)
+
+    async def setup(self, client, target):
+        await client.select_target(target)
+        await client.count_halts()
+        await client.define_procs()
+
+    async def close_async(self, key):
+        client = self.clients.pop(key, None)
+        self.addresses.pop(key, None)
+        self.reopening.pop(key, None)
+        self.shadows.pop(key, None)
+        if client:
+            await client.close()
+
+
+class WriteQueue:
+    """Writes waiting to be sent, only the last value per target and address is
+    kept. A rewritten address moves to the end, so the order of last writes is
+    the order they are sent in. Masks of writes to one address are merged, so
+    edits of several fields become one masked update."""
+
+    def __init__(self):
+        self.pending = {}
+        self.coalesced = 0
+        self.sent = 0
+
+    def __len__(self):
+        return len(self.pending)
+
+    def put(self, key, addr, val, mask=FULL_MASK):
+        old = self.pending.pop((key, addr), None)
+        if old is not None:
+            self.coalesced += 1
+            val = (old[0] & ~mask) | (val & mask)
+            mask |= old[1]
+        self.pending[(key, addr)] = (val, mask)
+
+    def take(self):
+        """Return pending writes as (key, [(addr, val, mask), ...]) and empty the queue"""
+        writes = {}
+        for (key, addr), (val, mask) in self.pending.items():
+            writes.setdefault(key, []).append((addr, val, mask))
+        self.sent += len(self.pending)
+        self.pending = {}
+        return list(writes.items())
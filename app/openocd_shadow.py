@@ -0,0 +1,48 @@
+#!/user/bin/env python3
+
+"""
+Shadow copy of target memory words read while the target is halted
+"""
+
+
+class ShadowCache:
+    """Last value of every 32-bit word read from the target.
+
+    Words are valid for one generation - while the target stays halted at
+    the same PC with the same halt count. Any other status starts a new
+    generation, writes drop the words they overlap. Hits and misses are
+    counted by the reader, which decides if the words found are used.
+    """
+
+    def __init__(self):
+        self.generation = 0
+        self.words = {}
+        self.status = None
+        self.hits = 0
+        self.misses = 0
+
+    def invalidate(self):
+        self.generation += 1
+        self.words = {}
+
+    def update_status(self, state, pc, halts):
+        # target has run since the words were read, or may run at any moment
+        status = (state, pc, halts)
+        if state != "halted" or status != self.status:
+            self.invalidate()
+        self.status = status if state == "halted" else None
+
+    def get(self, addr, count):
+        """Words of the block if all of them are there, None otherwise"""
+        words = [self.words.get(addr + 4 * i) for i in range(count)]
+        return None if None in words else words
+
+    def put(self, addr, words, generation):
+        # words read before an invalidation are older than it, so not stored
+        if generation == self.generation and self.status is not None:
+            for i, word in enumerate(words):
+                self.words[addr + 4 * i] = word
+
+    def forget(self, addr, size=4):
+        for word_addr in range(addr & ~0x3, addr + size, 4):
+            self.words.pop(word_addr, None)
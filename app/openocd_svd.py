@@ -11,13 +11,19 @@ Run (SVD path argument is optional):
 # -- Imports ------------------------------------------------------------------
 import sys
 import os
-import functools
+import asyncio
 import threading
 import time
-from svd import SVDReader
-from openocd import OpenOCDTelnet
-from PyQt5.QtWidgets import (QApplication, QMainWindow, QDialog, QWidget,
-                             QFileDialog, QLabel, QTreeWidgetItem, QAction, QMenu)
+from svd import SVDReader, SVDCancelled, SVDAddressMap
+from svd_cache import SVDCache
+from svd_catalog import SVDCatalog
+from openocd_async import OpenOCDLoop
+from openocd_pool import OpenOCDPool, WriteQueue
+from read_plan import ReadPlan, plan_reads, DEFAULT_GAP
+from PyQt5.QtCore import Qt, QEvent, QObject, QThread, QTimer, QSortFilterProxyModel, pyqtSignal
+from PyQt5.QtGui import QStandardItemModel, QStandardItem
+from PyQt5.QtWidgets import (QApplication, QMainWindow, QDialog, QWidget, QPushButton,
+                             QFileDialog, QLabel, QAction, QMenu, QLineEdit, QInputDialog)
 from ui_widgets import PeriphTab
 from ui_main import Ui_MainWindow
 from ui_about import Ui_AboutDialog
@@ -26,38 +32,98 @@ from ui_svd import Ui_SVDDialog
 
 # -- Global variables ---------------------------------------------------------
 VERSION = "1.0"
+SVD_CATALOG_SORT_ROLE = Qt.UserRole + 1
+# OpenOCD poll interval, s: the shortest one is used while any target is halted
+# or UI is in use, it is doubled up to the longest while targets run and UI is idle
+OPENOCD_POLL_MIN = 1
+OPENOCD_POLL_MAX = 8
+OPENOCD_UI_IDLE = 10
+# auto-writes to one register within this time, ms, are sent as one write of the last value
+OPENOCD_WRITE_DELAY = 100
 
 
 # -- Special classes ----------------------------------------------------------
-class RepeatedTimer(object):
-    def __init__(self, interval, function, *args, **kwargs):
-        self._timer = None
-        self.interval = interval
-        self.function = function
-        self.args = args
-        self.kwargs = kwargs
-        self.is_running = False
-        self.is_executing = False
-        self.next_call = time.time()
-        self.start()
-
-    def _run(self):
-        self.is_running = False
-        self.start()
-        self.is_executing = True
-        self.function(*self.args, **self.kwargs)
-        self.is_executing = False
-
-    def start(self):
-        if not self.is_running:
-            self.next_call += self.interval
-            self._timer = threading.Timer(self.next_call - time.time(), self._run)
-            self._timer.start()
-            self.is_running = True
-
-    def stop(self):
-        self._timer.cancel()
-        self.is_running = False
+class SVDLoader(QThread):
+    periphLoaded = pyqtSignal(object, int, int)
+    loaded = pyqtSignal(object)
+    failed = pyqtSignal(str)
+    cancelled = pyqtSignal()
+    indexed = pyqtSignal(object)
+    indexFailed = pyqtSignal(str)
+
+    def __init__(self, svd_reader, path, name, parent=None):
+        QThread.__init__(self, parent)
+        self.svd_reader = svd_reader
+        self.path = path
+        self.name = name
+        self.cancel_event = threading.Event()
+
+    def run(self):
+        try:
+            self.svd_reader.parse_path(self.path, self.periphLoaded.emit, self.cancel_event)
+            device = self.svd_reader.device
+            self.loaded.emit(device)
+        except SVDCancelled:
+            self.cancelled.emit()
+            return
+        except Exception as e:
+            self.failed.emit(str(e) if str(e) else type(e).__name__)
+            return
+        # address map parses every lazy peripheral, so it is built here while the
+        # opened SVD is already in use
+        try:
+            self.indexed.emit(SVDAddressMap(device, self.cancel_event))
+        except SVDCancelled:
+            pass
+        except Exception as e:
+            self.indexFailed.emit(str(e) if str(e) else type(e).__name__)
+
+    def cancel(self):
+        self.cancel_event.set()
+
+
+class SVDCatalogLoader(QThread):
+    loaded = pyqtSignal(object)
+    failed = pyqtSignal(str)
+
+    def __init__(self, svd_catalog, parent=None):
+        QThread.__init__(self, parent)
+        self.svd_catalog = svd_catalog
+
+    def run(self):
+        try:
+            self.loaded.emit(self.svd_catalog.entries())
+        except Exception as e:
+            self.failed.emit(str(e) if str(e) else type(e).__name__)
+
+
+class OpenOCDBridge(QObject):
+    """Run coroutines of asyncio OpenOCD clients on OpenOCDLoop thread,
+    callbacks are called in the GUI thread with the finished future"""
+    done = pyqtSignal(object, object)
+
+    def __init__(self, loop=None, parent=None):
+        QObject.__init__(self, parent)
+        self.loop = loop if loop else OpenOCDLoop()
+        # emitted from the loop thread, so delivered through the GUI event queue
+        self.done.connect(self.handle_done)
+
+    def call(self, coro, callback=None):
+        future = self.loop.submit(coro)
+        if callback:
+            future.add_done_callback(lambda future: self.done.emit(callback, future))
+        return future
+
+    def handle_done(self, callback, future):
+        callback(future)
+
+
+class SVDCatalogFilter(QSortFilterProxyModel):
+    # show all files of vendor when vendor itself matches the filter
+    def filterAcceptsRow(self, row, parent):
+        if QSortFilterProxyModel.filterAcceptsRow(self, row, parent):
+            return True
+        return parent.isValid() and QSortFilterProxyModel.filterAcceptsRow(self, parent.row(), parent.parent())
 
 
 # -- Main window --------------------------------------------------------------
@@ -73,6 +139,11 @@ class MainWindow(QMainWindow):
         self.ui.lab_status = QLabel()
         self.ui.lab_status.setText("No connection")
         self.ui.statusBar.addPermanentWidget(self.ui.lab_status)
+        self.ui.btn_cancel_load = QPushButton("Cancel")
+        self.ui.btn_cancel_load.setFlat(True)
+        self.ui.btn_cancel_load.clicked.connect(self.handle_btn_cancel_load_clicked)
+        self.ui.btn_cancel_load.hide()
+        self.ui.statusBar.addPermanentWidget(self.ui.btn_cancel_load)
 
         self.about_dialog = QDialog(self)
         self.about_dialog.ui = Ui_AboutDialog()
@@ -81,27 +152,146 @@ class MainWindow(QMainWindow):
         self.svd_dialog = QDialog(self)
         self.svd_dialog.ui = Ui_SVDDialog()
         self.svd_dialog.ui.setupUi(self.svd_dialog)
-        self.svd_dialog.ui.tree_svd.itemDoubleClicked.connect(self.handle_svd_dialog_item_double_clicked)
-        self.svd_dialog.ui.tree_svd.headerItem().setText(0, "List of packed SVD")
+        self.svd_dialog.ui.tree_svd.doubleClicked.connect(self.handle_svd_dialog_item_double_clicked)
+        self.svd_dialog.ui.edit_filter.textChanged.connect(self.handle_svd_dialog_filter_changed)
+        self.svd_dialog.catalog_model = None
+        self.svd_dialog.catalog_filter = SVDCatalogFilter(self.svd_dialog)
+        self.svd_dialog.catalog_filter.setFilterCaseSensitivity(Qt.CaseInsensitive)
+        self.svd_dialog.catalog_filter.setFilterKeyColumn(-1)
+        self.svd_dialog.catalog_filter.setRecursiveFilteringEnabled(True)
+        self.svd_dialog.catalog_filter.setSortRole(SVD_CATALOG_SORT_ROLE)
+        self.svd_dialog.ui.tree_svd.setModel(self.svd_dialog.catalog_filter)
+
+        self.ui.act_clear_cache = QAction(self)
+        self.ui.act_clear_cache.setObjectName("act_clear_cache")
+        self.ui.act_clear_cache.setText("Clear SVD cache")
+        self.ui.act_clear_cache.setStatusTip("Remove all parsed SVD files from the cache")
+        self.ui.act_clear_cache.triggered.connect(self.handle_act_clear_cache_triggered)
+        self.ui.menuOptions.addSeparator()
+        self.ui.menuOptions.addAction(self.ui.act_clear_cache)
+
+        self.ui.act_tcl_rpc = QAction(self)
+        self.ui.act_tcl_rpc.setObjectName("act_tcl_rpc")
+        self.ui.act_tcl_rpc.setCheckable(True)
+        self.ui.act_tcl_rpc.setText("Use TCL RPC")
+        self.ui.act_tcl_rpc.setStatusTip("Connect to OpenOCD TCL RPC port 6666 instead of telnet port 4444")
+        self.ui.act_tcl_rpc.toggled.connect(self.handle_act_tcl_rpc_toggled)
+        self.ui.menuOptions.insertAction(self.ui.act_autowrite, self.ui.act_tcl_rpc)
+
+        self.ui.act_read_gap = QAction(self)
+        self.ui.act_read_gap.setObjectName("act_read_gap")
+        self.ui.act_read_gap.setText("Read all gap...")
+        self.ui.act_read_gap.setStatusTip("Registers closer than this many bytes are read by Read all with one request")
+        self.ui.act_read_gap.triggered.connect(self.handle_act_read_gap_triggered)
+        self.ui.menuOptions.insertAction(self.ui.act_autowrite, self.ui.act_read_gap)
+
+        self.ui.act_shadow_cache = QAction(self)
+        self.ui.act_shadow_cache.setObjectName("act_shadow_cache")
+        self.ui.act_shadow_cache.setCheckable(True)
+        self.ui.act_shadow_cache.setChecked(True)
+        self.ui.act_shadow_cache.setText("Cache register reads")
+        self.ui.act_shadow_cache.setStatusTip("Registers are not read again while the target stays halted, "
+                                              "status registers are always read")
+        self.ui.menuOptions.insertAction(self.ui.act_autowrite, self.ui.act_shadow_cache)
+
+        self.ui.act_write_delay = QAction(self)
+        self.ui.act_write_delay.setObjectName("act_write_delay")
+        self.ui.act_write_delay.setText("Auto-write delay...")
+        self.ui.act_write_delay.setStatusTip("Auto-writes within this time are sent as one write of the last value")
+        self.ui.act_write_delay.triggered.connect(self.handle_act_write_delay_triggered)
+        self.ui.menuOptions.insertAction(self.ui.act_autoread, self.ui.act_write_delay)
+
+        self.ui.act_add_connection = QAction(self)
+        self.ui.act_add_connection.setObjectName("act_add_connection")
+        self.ui.act_add_connection.setText("Add OpenOCD connection...")
+        self.ui.act_add_connection.setStatusTip("Connect to one more OpenOCD, every its target can be chosen by tabs")
+        self.ui.act_add_connection.triggered.connect(self.handle_act_add_connection_triggered)
+        file_actions = self.ui.menuFile.actions()
+        self.ui.menuFile.insertAction(file_actions[file_actions.index(self.ui.act_connect) + 1],
+                                      self.ui.act_add_connection)
+
+        self.ui.edit_goto = QLineEdit(self)
+        self.ui.edit_goto.setPlaceholderText("Go to address")
+        self.ui.edit_goto.setToolTip("Find register by absolute address, several addresses can be separated by spaces")
+        self.ui.edit_goto.setClearButtonEnabled(True)
+        self.ui.edit_goto.setMaximumWidth(200)
+        self.ui.edit_goto.returnPressed.connect(self.handle_edit_goto_return_pressed)
+        self.ui.menubar.setCornerWidget(self.ui.edit_goto)
 
         # Add some vars
-        self.svd_reader = SVDReader()
-        self.openocd_tn = OpenOCDTelnet()
-        self.openocd_rt = None
+        self.svd_cache = SVDCache()
+        self.svd_catalog = SVDCatalog()
+        self.svd_catalog_loader = None
+        self.svd_reader = SVDReader(self.svd_cache, backend="iterparse", lazy=True)
+        self.svd_loader = None
+        self.svd_device = []
+        self.svd_address_map = None
+        self.svd_address_error = None
+        self.svd_goto_pending = False
+        self.openocd_bridge = OpenOCDBridge(parent=self)
+        self.openocd_pool = OpenOCDPool()
+        self.openocd_address = "localhost:4444"
+        self.openocd_status = {}
+        self.openocd_poll = None
+        self.openocd_poll_timer = QTimer(self)
+        self.openocd_poll_timer.setInterval(OPENOCD_POLL_MIN * 1000)
+        self.openocd_poll_timer.timeout.connect(self.handle_poll_timer_timeout)
+        self.openocd_flush = None
+        self.openocd_writes = WriteQueue()
+        self.openocd_write_timer = QTimer(self)
+        self.openocd_write_timer.setSingleShot(True)
+        self.openocd_write_timer.setInterval(OPENOCD_WRITE_DELAY)
+        self.openocd_write_timer.timeout.connect(self.handle_write_timer_timeout)
+        self.openocd_ui_time = time.monotonic()
+        QApplication.instance().installEventFilter(self)
         self.opt_autoread = False
+        self.opt_read_gap = DEFAULT_GAP
 
     # -- Events --
+    def eventFilter(self, obj, event):
+        # any user input makes polling fast again
+        if event.type() in (QEvent.MouseButtonPress, QEvent.KeyPress, QEvent.Wheel):
+            self.openocd_ui_time = time.monotonic()
+            if self.openocd_poll_timer.isActive() and self.openocd_poll_timer.interval() > OPENOCD_POLL_MIN * 1000:
+                self.openocd_poll_timer.setInterval(OPENOCD_POLL_MIN * 1000)
+        return QMainWindow.eventFilter(self, obj, event)
+
     def closeEvent(self, event):
-        if self.openocd_tn.is_opened:
-            self.disconnect_openocd()
+        self.__stop_svd_loader()
+        if self.svd_catalog_loader:
+            self.svd_catalog_loader.wait()
+        if self.openocd_poll_timer.isActive():
+            # pending writes are sent before the window is gone
+            self.disconnect_openocd().result()
         event.accept()
 
     # -- Slots --
     def handle_act_connect_triggered(self):
-        if self.openocd_tn.is_opened:
+        if self.openocd_poll_timer.isActive():
             self.disconnect_openocd()
         else:
-            self.connect_openocd()
+            self.connect_openocd("localhost", 6666 if self.ui.act_tcl_rpc.isChecked() else 4444)
+
+    def handle_act_add_connection_triggered(self):
+        address, ok = QInputDialog.getText(self, "Add OpenOCD connection",
+                                           "OpenOCD host:port (%s):" % ("TCL RPC" if self.ui.act_tcl_rpc.isChecked()
+                                                                        else "telnet"),
+                                           text=self.openocd_address)
+        if not ok:
+            return
+        host, _, port = address.strip().rpartition(":")
+        try:
+            port = int(port)
+        except ValueError:
+            self.ui.statusBar.showMessage("Wrong OpenOCD address: %s" % address)
+            return
+        self.openocd_address = address.strip()
+        self.connect_openocd(host if host else "localhost", port)
+
+    def handle_act_tcl_rpc_toggled(self, state):
+        port = self.openocd_address.rpartition(":")[2]
+        if port in ("4444", "6666"):
+            self.openocd_address = "%s:%d" % (self.openocd_address.rpartition(":")[0], 6666 if state else 4444)
 
     def handle_act_open_svd_triggered(self):
         options = QFileDialog.Options()
@@ -112,30 +302,39 @@ class MainWindow(QMainWindow):
             self.open_svd_path(fileName)
 
     def handle_act_open_packed_svd_triggered(self):
-        self.svd_dialog.ui.tree_svd.clear()
-        for vendor in self.svd_reader.get_packed_list():
-            vendor_name = vendor["vendor"]
-            item0 = QTreeWidgetItem(self.svd_dialog.ui.tree_svd)
-            item0.setText(0, vendor_name)
-            item0.is_vendor = True
-            self.svd_dialog.ui.tree_svd.addTopLevelItem(item0)
-            for filename in vendor["filenames"]:
-                item1 = QTreeWidgetItem(item0)
-                item1.is_vendor = False
-                item1.setText(0, filename)
-                item0.addChild(item1)
-        if self.svd_dialog.exec_() and (not self.svd_dialog.ui.tree_svd.currentItem().is_vendor):
-            vendor = self.svd_dialog.ui.tree_svd.currentItem().parent().text(0)
-            filename = self.svd_dialog.ui.tree_svd.currentItem().text(0)
-            self.open_svd_packed(vendor, filename)
-
-    def handle_svd_dialog_item_double_clicked(self, item, col):
-        if not item.is_vendor:
-            vendor = item.parent().text(0)
-            filename = item.text(0)
-            self.open_svd_packed(vendor, filename)
+        if self.svd_dialog.catalog_model is None and not self.svd_catalog_loader:
+            # catalog scan can take seconds, the dialog is filled when it is done
+            self.__set_svd_catalog_message("Loading packed SVD catalog...")
+            self.svd_catalog_loader = SVDCatalogLoader(self.svd_catalog, self)
+            self.svd_catalog_loader.loaded.connect(self.handle_svd_catalog_loaded)
+            self.svd_catalog_loader.failed.connect(self.handle_svd_catalog_failed)
+            self.svd_catalog_loader.start()
+        self.svd_dialog.ui.edit_filter.selectAll()
+        self.svd_dialog.ui.edit_filter.setFocus()
+        if self.svd_dialog.exec_():
+            packed = self.svd_dialog.ui.tree_svd.currentIndex().siblingAtColumn(0).data(Qt.UserRole)
+            if packed:
+                self.open_svd_packed(*packed)
+
+    def handle_svd_dialog_item_double_clicked(self, index):
+        if index.siblingAtColumn(0).data(Qt.UserRole):
             self.svd_dialog.accept()
 
+    def handle_svd_catalog_loaded(self, entries):
+        self.svd_catalog_loader = None
+        self.__build_svd_catalog_model(entries)
+
+    def handle_svd_catalog_failed(self, error):
+        self.svd_catalog_loader = None
+        self.__set_svd_catalog_message("Can't load packed SVD catalog - %s" % error)
+
+    def handle_svd_dialog_filter_changed(self, text):
+        self.svd_dialog.catalog_filter.setFilterFixedString(text)
+        if text:
+            self.svd_dialog.ui.tree_svd.expandAll()
+        else:
+            self.svd_dialog.ui.tree_svd.collapseAll()
+
     def handle_act_about_triggered(self):
         text = self.about_dialog.ui.lab_version.text().replace("x.x", VERSION)
         self.about_dialog.ui.lab_version.setText(text)
@@ -143,53 +342,83 @@ class MainWindow(QMainWindow):
 
     def handle_act_periph_triggered(self):
         sender_name = self.sender().objectName()
-        for periph in self.svd_reader.device:
+        for periph in self.svd_device:
             if sender_name == periph["name"]:
-                periph_num = self.svd_reader.device.index(periph)
-                periph_name = self.svd_reader.device[periph_num]["name"]
+                self.open_periph_tab(periph)
                 break
 
-        if (self.ui.tabs_device.findChild(QWidget, periph_name)):
-            self.ui.tabs_device.setCurrentWidget(self.ui.tabs_device.findChild(QWidget, periph_name))
-        else:
-            periph_tab = PeriphTab(self.svd_reader.device[periph_num])
-            for i in range(0, periph_tab.tree_regs.topLevelItemCount()):
-                reg = periph_tab.tree_regs.itemWidget(periph_tab.tree_regs.topLevelItem(i), 1)
-                reg.btn_read.clicked.connect(functools.partial(self.handle_btn_read_clicked, index=i))
-                reg.btn_write.clicked.connect(functools.partial(self.handle_btn_write_clicked, index=i))
-            self.ui.tabs_device.addTab(periph_tab, periph_name)
-            self.ui.tabs_device.setCurrentIndex(self.ui.tabs_device.count() - 1)
+    def handle_edit_goto_return_pressed(self):
+        if not self.svd_device:
+            return
+        try:
+            addrs = [int(text, 0) for text in self.ui.edit_goto.text().replace(",", " ").split()]
+        except ValueError:
+            self.ui.statusBar.showMessage("Wrong address: %s" % self.ui.edit_goto.text())
+            return
+        if self.svd_address_error:
+            self.ui.statusBar.showMessage("Can't look up addresses - %s" % self.svd_address_error)
+            return
+        if self.svd_address_map is None:
+            # the loader builds the map, lookup is repeated when it is ready
+            self.svd_goto_pending = True
+            self.ui.statusBar.showMessage("Indexing addresses...")
+            return
+        results = self.svd_address_map.lookup_many(addrs)
+        found = []
+        for addr, result in zip(addrs, results):
+            if result is None:
+                found += ["0x%08X: -" % addr]
+                continue
+            periph, reg, fields = result
+            bits = ", ".join("%s[%d:%d]" % (field.name, field.msb, field.lsb) for field in fields)
+            found += ["0x%08X: %s.%s%s" % (addr, periph.name, reg.name, " " + bits if bits else "")]
+        # the first found register is shown in its peripheral tab
+        for result in results:
+            if result:
+                periph_tab = self.open_periph_tab(result[0])
+                if periph_tab:
+                    periph_tab.select_reg(result[1])
+                break
+        self.ui.statusBar.showMessage(" | ".join(found))
 
     def handle_btn_read_clicked(self, index):
-        if self.openocd_tn.is_opened:
-            periph = self.ui.tabs_device.currentWidget()
-            reg = periph.tree_regs.itemWidget(periph.tree_regs.topLevelItem(index), 1)
-            addr = periph.svd["base_address"] + reg.svd["address_offset"]
-            try:
-                reg.setVal(self.openocd_tn.read_mem(addr))
-                self.ui.statusBar.showMessage("Read %s.%s @ 0x%08X - OK" % (periph.svd["name"],
-                                                                            reg.svd["name"],
-                                                                            addr))
-            except RuntimeError:
-                self.ui.statusBar.showMessage("Read %s.%s @ 0x%08X - Error" % (periph.svd["name"],
-                                                                               reg.svd["name"],
-                                                                               addr))
+        periph = self.ui.tabs_device.currentWidget()
+        if periph.target():
+            reg = periph.model.regs[index]
+            addr = periph.svd["base_address"] + reg["address_offset"]
+            read = (periph.target(), [(addr, 1)], [reg.is_volatile()])
+            self.openocd_bridge.call(self.openocd_pool.read_many_async([read], self.ui.act_shadow_cache.isChecked()),
+                                     lambda future: self.__show_read(periph, index, "%s.%s @ 0x%08X" % (
+                                         periph.svd["name"], reg["name"], addr), future))
+
+    def handle_btn_readall_clicked(self):
+        self.read_periph_tabs([self.ui.tabs_device.currentWidget()])
 
     def handle_btn_write_clicked(self, index):
-        if self.openocd_tn.is_opened:
-            periph = self.ui.tabs_device.currentWidget()
-            reg = periph.tree_regs.itemWidget(periph.tree_regs.topLevelItem(index), 1)
-            addr = periph.svd["base_address"] + reg.svd["address_offset"]
-            try:
-                self.openocd_tn.write_mem(addr, reg.val())
-                self.ui.statusBar.showMessage("Write %s.%s @ 0x%08X - OK" % (periph.svd["name"],
-                                                                             reg.svd["name"],
-                                                                             addr))
-
-            except RuntimeError:
-                self.ui.statusBar.showMessage("Write %s.%s @ 0x%08X - Error" % (periph.svd["name"],
-                                                                                reg.svd["name"],
-                                                                                addr))
+        # explicit write is sent at once together with all delayed auto-writes
+        periph = self.ui.tabs_device.currentWidget()
+        if periph.target():
+            reg = periph.model.regs[index]
+            addr = periph.svd["base_address"] + reg["address_offset"]
+            self.openocd_writes.put(periph.target(), addr, periph.model.val(index), periph.model.takeEditedMask(index))
+            self.flush_writes("Write %s.%s @ 0x%08X" % (periph.svd["name"], reg["name"], addr))
+
+    def handle_reg_write_requested(self, index):
+        # auto-write waits for further changes of the value
+        periph = self.ui.tabs_device.currentWidget()
+        if periph.target():
+            reg = periph.model.regs[index]
+            addr = periph.svd["base_address"] + reg["address_offset"]
+            self.openocd_writes.put(periph.target(), addr, periph.model.val(index), periph.model.takeEditedMask(index))
+            self.openocd_write_timer.start()
+
+    def handle_write_timer_timeout(self):
+        self.flush_writes("Auto-write %d registers" % len(self.openocd_writes))
+
+    def handle_poll_timer_timeout(self):
+        # the next poll is not queued behind one which still waits for a reply
+        if self.openocd_poll is None or self.openocd_poll.done():
+            self.__poll_openocd()
 
     def handle_tab_periph_close(self, num):
         widget = self.ui.tabs_device.widget(num)
@@ -199,102 +428,414 @@ class MainWindow(QMainWindow):
 
     def handle_act_autowrite_toggled(self, state):
         for tab_n in range(0, self.ui.tabs_device.count()):
-            tab = self.ui.tabs_device.widget(tab_n)
-            for reg_n in range(0, tab.tree_regs.topLevelItemCount()):
-                reg = tab.tree_regs.itemWidget(tab.tree_regs.topLevelItem(reg_n), 1)
-                reg.setAutoWrite(state)
+            self.ui.tabs_device.widget(tab_n).model.setAutoWrite(state)
 
     def handle_act_autoread_toggled(self, state):
         self.opt_autoread = state
 
+    def handle_act_write_delay_triggered(self):
+        delay, ok = QInputDialog.getInt(self, "Auto-write delay",
+                                        "Auto-writes to one register within this many ms\n"
+                                        "are sent as one write of the last value:",
+                                        self.openocd_write_timer.interval(), 0, 5000)
+        if ok:
+            self.openocd_write_timer.setInterval(delay)
+
+    def handle_act_read_gap_triggered(self):
+        gap, ok = QInputDialog.getInt(self, "Read all gap",
+                                      "Registers not further than this many bytes apart\n"
+                                      "are read with one request:", self.opt_read_gap, 0, 65536)
+        if ok:
+            self.opt_read_gap = gap
+
+    def handle_svd_periph_loaded(self, periph, done, total):
+        if self.sender() is not self.svd_loader:
+            return
+        self.svd_device += [periph]
+        self.__add_menu_periph(periph)
+        self.ui.statusBar.showMessage("Loading %s: %d/%d peripherals" % (self.svd_loader.name, done, total))
+
+    def handle_svd_loaded(self, device):
+        if self.sender() is not self.svd_loader:
+            return
+        # rebuild menu to get peripherals sorted by address
+        self.svd_device = device
+        self.svd_address_map = None
+        self.__clear_menu_view()
+        self.__update_menu_view()
+        self.ui.btn_cancel_load.hide()
+        self.__show_cache_stats(self.svd_loader.name)
+
+    def handle_svd_indexed(self, address_map):
+        if self.sender() is not self.svd_loader:
+            return
+        self.svd_address_map = address_map
+        if self.svd_goto_pending:
+            self.svd_goto_pending = False
+            self.handle_edit_goto_return_pressed()
+
+    def handle_svd_index_failed(self, error):
+        if self.sender() is not self.svd_loader:
+            return
+        self.svd_address_error = error
+        if self.svd_goto_pending:
+            self.svd_goto_pending = False
+            self.handle_edit_goto_return_pressed()
+
+    def handle_svd_failed(self, error):
+        if self.sender() is not self.svd_loader:
+            return
+        name = self.svd_loader.name
+        self.close_svd()
+        self.ui.statusBar.showMessage("Can't open %s - %s" % (name, error))
+
+    def handle_svd_cancelled(self):
+        if self.sender() is not self.svd_loader:
+            return
+        name = self.svd_loader.name
+        self.close_svd()
+        self.ui.statusBar.showMessage("Opening of %s cancelled" % name)
+
+    def handle_btn_cancel_load_clicked(self):
+        if self.svd_loader:
+            self.svd_loader.cancel()
+
+    def handle_act_clear_cache_triggered(self):
+        self.svd_cache.clear()
+        self.ui.statusBar.showMessage("SVD cache cleared")
+
     # -- Application specific code --
+    def open_periph_tab(self, periph):
+        # registers of a lazy peripheral are parsed here, broken ones are reported
+        # and no tab is opened
+        periph_tab = self.ui.tabs_device.findChild(QWidget, periph["name"])
+        if periph_tab:
+            self.ui.tabs_device.setCurrentWidget(periph_tab)
+        else:
+            try:
+                periph.regs
+            except Exception as e:
+                self.ui.statusBar.showMessage("Can't open %s - %s" % (periph["name"],
+                                                                      str(e) if str(e) else type(e).__name__))
+                return None
+            periph_tab = PeriphTab(periph)
+            periph_tab.setTargets(self.__targets())
+            periph_tab.btn_readall.clicked.connect(self.handle_btn_readall_clicked)
+            periph_tab.model.setAutoWrite(self.ui.act_autowrite.isChecked())
+            periph_tab.model.readRequested.connect(self.handle_btn_read_clicked)
+            periph_tab.model.writeRequested.connect(self.handle_btn_write_clicked)
+            periph_tab.model.autoWriteRequested.connect(self.handle_reg_write_requested)
+            self.ui.tabs_device.addTab(periph_tab, periph["name"])
+            self.ui.tabs_device.setCurrentIndex(self.ui.tabs_device.count() - 1)
+        return periph_tab
+
+    def read_periph_tabs(self, tabs):
+        tabs = [tab for tab in tabs if tab.target()]
+        if tabs:
+            self.read_regs([(tab, row) for tab in tabs for row in range(len(tab.model.regs))],
+                           "Read all %s" % ", ".join(tab.svd["name"] for tab in tabs))
+
+    def read_regs(self, regs, message, lazy=False):
+        # (tab, row) registers of all tabs bound to one target are merged into one
+        # plan, so neighbouring peripherals share block reads; registers with read
+        # side effects are skipped; the plan of every target is one pipelined batch
+        # and targets are read in parallel; volatile registers are planned apart as
+        # they are never taken from the shadow cache
+        items = {}
+        for tab, row in regs:
+            if tab.target():
+                reg = tab.model.regs[row]
+                items.setdefault(tab.target(), []).append((tab.svd["base_address"] + reg["address_offset"],
+                                                           reg, tab, row))
+        plans = []
+        reads = []
+        for target, target_items in items.items():
+            stable = plan_reads(target_items, self.opt_read_gap, lambda reg: reg.is_volatile())
+            volatile = plan_reads(stable.skipped, self.opt_read_gap)
+            plans += [ReadPlan(stable.spans + volatile.spans, volatile.skipped)]
+            reads += [(target, [(span.addr, span.count) for span in plans[-1].spans],
+                       [False] * len(stable.spans) + [True] * len(volatile.spans))]
+        if reads:
+            self.openocd_bridge.call(self.openocd_pool.read_many_async(reads, self.ui.act_shadow_cache.isChecked()),
+                                     lambda future: self.__show_read_all(message, list(items), plans, lazy, future))
+
+    def flush_writes(self, message):
+        # all pending writes go as one batch per target, targets in parallel; edits
+        # of fields only are applied on the target side and new values are shown;
+        # while a batch is on the way new writes wait, so they can't overtake it
+        if self.openocd_flush and not self.openocd_flush.done():
+            self.openocd_write_timer.start()
+            return
+        self.openocd_write_timer.stop()
+        writes = self.openocd_writes.take()
+        self.openocd_flush = self.openocd_bridge.call(self.openocd_pool.write_many_async(writes),
+                                                      lambda future: self.__show_written(message, writes, future))
+
+    def __show_read(self, tab, row, name, future):
+        result = future.result()[0]
+        if isinstance(result, Exception):
+            self.ui.statusBar.showMessage("Read %s - Error" % name)
+            return
+        if tab in self.__periph_tabs():
+            tab.setVal(row, result[0][0][0])
+        self.ui.statusBar.showMessage("Read %s - OK" % name)
+
+    def __show_read_all(self, message, targets, plans, lazy, future):
+        # tabs closed while the reads were on the way are skipped; lazy values of
+        # hidden tabs are shown when a tab is shown, pinned ones at once; what was
+        # actually sent is reported, blocks taken from the shadow cache are not
+        open_tabs = set(self.__periph_tabs())
+        errors = 0
+        stats = []
+        for plan, result in zip(plans, future.result()):
+            if isinstance(result, Exception):
+                errors += 1
+                continue
+            blocks, sent, round_trips = result
+            stats += ["%d round trips, %d of %d blocks, %d bytes read, %d skipped" % (
+                round_trips, len(sent), len(plan.spans), sum(plan.spans[num].count * 4 for num in sent),
+                len(plan.skipped))]
+            for span, words in zip(plan.spans, blocks):
+                for item, val in span.values(words):
+                    tab, row = item[2], item[3]
+                    if tab in open_tabs:
+                        tab.setVal(row, val, lazy and not tab.model.isPinned(row))
+        shadows = [self.openocd_pool.shadows[target] for target in targets if target in self.openocd_pool.shadows]
+        self.ui.statusBar.showMessage("%s - %s (%s) | Shadow cache: %d hits, %d misses" % (
+            message, "Error" if errors else "OK", "; ".join(stats),
+            sum(shadow.hits for shadow in shadows), sum(shadow.misses for shadow in shadows)))
+
+    def __show_written(self, message, writes, future):
+        errors = 0
+        for (target, words), result in zip(writes, future.result()):
+            if isinstance(result, Exception):
+                errors += 1
+            elif result:
+                self.__show_values(target, dict(result))
+        self.ui.statusBar.showMessage("%s - %s (writes: %d sent, %d coalesced)" % (message,
+                                                                                  "Error" if errors else "OK",
+                                                                                  self.openocd_writes.sent,
+                                                                                  self.openocd_writes.coalesced))
+
+    def __show_values(self, target, values):
+        for tab in self.__periph_tabs():
+            if tab.target() == target:
+                for row, reg in enumerate(tab.model.regs):
+                    addr = tab.svd["base_address"] + reg["address_offset"]
+                    if addr in values:
+                        tab.setVal(row, values[addr])
+
+    def __periph_tabs(self):
+        return [self.ui.tabs_device.widget(tab_n) for tab_n in range(0, self.ui.tabs_device.count())]
+
     def close_svd(self):
+        self.__stop_svd_loader()
         title = self.windowTitle()
         title = title.split(" - ")[-1]
         self.setWindowTitle(title)
         while self.ui.tabs_device.currentIndex() != -1:
             self.handle_tab_periph_close(self.ui.tabs_device.currentIndex())
-        self.ui.menuView.clear()
-        self.ui.menu_periph.clear()
+        self.__clear_menu_view()
+        self.svd_device = []
+        self.svd_address_map = None
+        self.svd_address_error = None
+        self.svd_goto_pending = False
 
     def open_svd_path(self, path):
-        try:
-            self.close_svd()
-            self.svd_reader.parse_path(path)
-            self.setWindowTitle(os.path.basename(path) + " - " + self.windowTitle())
-            self.__update_menu_view()
-        except:
-            self.ui.statusBar.showMessage("Can't open %s - file is corrupted!" % os.path.basename(path))
+        self.__start_svd_loader(path, os.path.basename(path))
 
     def open_svd_packed(self, vendor, filename):
-        try:
-            self.close_svd()
-            self.svd_reader.parse_packed(vendor, filename)
-            self.setWindowTitle(filename + " - " + self.windowTitle())
-            self.__update_menu_view()
-        except:
-            self.ui.statusBar.showMessage("Can't open %s - file is corrupted!" % filename)
+        self.__start_svd_loader(self.svd_reader.packed_path(vendor, filename), filename)
+
+    def __start_svd_loader(self, path, name):
+        # parsing is done in the separate thread, peripherals come back one by one
+        self.close_svd()
+        self.setWindowTitle(name + " - " + self.windowTitle())
+        self.svd_loader = SVDLoader(self.svd_reader, path, name, self)
+        self.svd_loader.periphLoaded.connect(self.handle_svd_periph_loaded)
+        self.svd_loader.loaded.connect(self.handle_svd_loaded)
+        self.svd_loader.failed.connect(self.handle_svd_failed)
+        self.svd_loader.cancelled.connect(self.handle_svd_cancelled)
+        self.svd_loader.indexed.connect(self.handle_svd_indexed)
+        self.svd_loader.indexFailed.connect(self.handle_svd_index_failed)
+        self.ui.statusBar.showMessage("Loading %s" % name)
+        self.ui.btn_cancel_load.show()
+        self.svd_loader.start()
+
+    def __stop_svd_loader(self):
+        if self.svd_loader:
+            self.svd_loader.cancel()
+            self.svd_loader.wait()
+            self.svd_loader = None
+        self.ui.btn_cancel_load.hide()
+
+    def __set_svd_catalog_message(self, message):
+        # placeholder shown in the dialog until the catalog model is built
+        model = QStandardItemModel(self.svd_dialog)
+        model.setHorizontalHeaderLabels(["Packed SVD"])
+        item = QStandardItem(message)
+        item.setFlags(Qt.NoItemFlags)
+        model.appendRow(item)
+        self.svd_dialog.catalog_filter.setSourceModel(model)
+
+    def __build_svd_catalog_model(self, entries):
+        model = QStandardItemModel(self.svd_dialog)
+        model.setHorizontalHeaderLabels(["Packed SVD", "Device", "CPU", "Peripherals", "Size, KiB"])
+        vendors = {}
+        for entry in entries:
+            if entry["vendor"] not in vendors:
+                vendors[entry["vendor"]] = QStandardItem(entry["vendor"])
+                vendors[entry["vendor"]].setData(entry["vendor"].lower(), SVD_CATALOG_SORT_ROLE)
+                model.appendRow([vendors[entry["vendor"]]] + [QStandardItem() for i in range(4)])
+            row = [QStandardItem(entry["filename"]),
+                   QStandardItem(entry["device"]),
+                   QStandardItem(entry["cpu"]),
+                   QStandardItem(str(entry["periphs"])),
+                   QStandardItem(str(entry["size"] // 1024))]
+            for item, sort_key in zip(row, [entry["filename"].lower(), entry["device"].lower(),
+                                            entry["cpu"].lower(), entry["periphs"], entry["size"]]):
+                item.setData(sort_key, SVD_CATALOG_SORT_ROLE)
+            row[0].setData((entry["vendor"], entry["filename"]), Qt.UserRole)
+            vendors[entry["vendor"]].appendRow(row)
+        self.svd_dialog.catalog_model = model
+        self.svd_dialog.catalog_filter.setSourceModel(model)
+        self.svd_dialog.ui.tree_svd.sortByColumn(0, Qt.AscendingOrder)
+        self.svd_dialog.ui.tree_svd.setColumnWidth(0, 220)
+
+    def __show_cache_stats(self, name):
+        self.ui.statusBar.showMessage("Opened %s | SVD cache: %d hits, %d misses" % (name,
+                                                                                 self.svd_cache.hits,
+                                                                                 self.svd_cache.misses))
+
+    def __clear_menu_view(self):
+        self.ui.menuView.clear()
+        self.ui.menu_periph.clear()
+        self.ui.act_periph.clear()
 
     def __update_menu_view(self):
-        for periph in self.svd_reader.device:
-                if periph["name"] == periph["group_name"]:
-                    self.ui.act_periph += [QAction(self)]
-                    self.ui.act_periph[-1].setObjectName(periph["name"])
-                    self.ui.act_periph[-1].setText(periph["name"])
-                    self.ui.act_periph[-1].triggered.connect(self.handle_act_periph_triggered)
-                    self.ui.menuView.addAction(self.ui.act_periph[-1])
-                else:
-                    if periph["group_name"] in [menu.objectName() for menu in self.ui.menu_periph]:
-                        menu_num = [menu.objectName() for menu in self.ui.menu_periph].index(periph["group_name"])
-                    else:
-                        self.ui.menu_periph += [QMenu(self.ui.menubar)]
-                        menu_num = -1
-                        self.ui.menu_periph[menu_num].setObjectName(periph["group_name"])
-                        self.ui.menu_periph[menu_num].setTitle(periph["group_name"])
-                        self.ui.menuView.addAction(self.ui.menu_periph[menu_num].menuAction())
-                        self.ui.menu_periph[menu_num].act_periph = []
-                    self.ui.menu_periph[menu_num].act_periph += [QAction(self)]
-                    self.ui.menu_periph[menu_num].act_periph[-1].setObjectName(periph["name"])
-                    self.ui.menu_periph[menu_num].act_periph[-1].setText(periph["name"])
-                    self.ui.menu_periph[menu_num].act_periph[-1].triggered.connect(self.handle_act_periph_triggered)
-                    self.ui.menu_periph[menu_num].addAction(self.ui.menu_periph[menu_num].act_periph[-1])
-
-    def connect_openocd(self):
+        for periph in self.svd_device:
+            self.__add_menu_periph(periph)
+
+    def __add_menu_periph(self, periph):
+        if periph["name"] == periph["group_name"]:
+            self.ui.act_periph += [QAction(self)]
+            self.ui.act_periph[-1].setObjectName(periph["name"])
+            self.ui.act_periph[-1].setText(periph["name"])
+            self.ui.act_periph[-1].triggered.connect(self.handle_act_periph_triggered)
+            self.ui.menuView.addAction(self.ui.act_periph[-1])
+        else:
+            if periph["group_name"] in [menu.objectName() for menu in self.ui.menu_periph]:
+                menu_num = [menu.objectName() for menu in self.ui.menu_periph].index(periph["group_name"])
+            else:
+                self.ui.menu_periph += [QMenu(self.ui.menubar)]
+                menu_num = -1
+                self.ui.menu_periph[menu_num].setObjectName(periph["group_name"])
+                self.ui.menu_periph[menu_num].setTitle(periph["group_name"])
+                self.ui.menuView.addAction(self.ui.menu_periph[menu_num].menuAction())
+                self.ui.menu_periph[menu_num].act_periph = []
+            self.ui.menu_periph[menu_num].act_periph += [QAction(self)]
+            self.ui.menu_periph[menu_num].act_periph[-1].setObjectName(periph["name"])
+            self.ui.menu_periph[menu_num].act_periph[-1].setText(periph["name"])
+            self.ui.menu_periph[menu_num].act_periph[-1].triggered.connect(self.handle_act_periph_triggered)
+            self.ui.menu_periph[menu_num].addAction(self.ui.menu_periph[menu_num].act_periph[-1])
+
+    def connect_openocd(self, host, port):
+        self.ui.statusBar.showMessage("Connecting to OpenOCD at %s:%d..." % (host, port))
+        self.openocd_bridge.call(self.openocd_pool.connect_async(host, port, self.ui.act_tcl_rpc.isChecked()),
+                                 lambda future: self.__show_connected(host, port, future))
+
+    def __show_connected(self, host, port, future):
         try:
-            self.openocd_tn.open()
-            self.ui.act_connect.setText("Disconnect OpenOCD")
-            self.openocd_target = self.openocd_tn.get_target_name()
-            self.openocd_target_pc = self.openocd_tn.get_target_pc()
+            keys = future.result()
+        except Exception as e:
+            error = str(e) if str(e) else type(e).__name__
+            self.ui.statusBar.showMessage("Can't connect to OpenOCD at %s:%d - %s" % (host, port, error))
+            return
+        if not self.openocd_poll_timer.isActive():
             self.__poll_openocd()
-            self.openocd_rt = RepeatedTimer(1, self.__poll_openocd)
-        except:
-            self.ui.statusBar.showMessage("Can't connect to OpenOCD!")
+            self.openocd_poll_timer.start(OPENOCD_POLL_MIN * 1000)
+        self.ui.act_connect.setText("Disconnect OpenOCD")
+        self.__update_tabs_targets()
+        self.ui.statusBar.showMessage("Connected to %s" % ", ".join(keys))
 
     def __poll_openocd(self):
-        if self.openocd_tn.check_alive():
-            self.openocd_target_state = self.openocd_tn.get_target_state()
-            if self.openocd_target_state != "halted":
-                new_target_pc = self.openocd_target_pc
-            else:
-                new_target_pc = self.openocd_tn.get_target_pc()
-            self.ui.lab_status.setText("Connected: %s | %s | 0x%08X" % (self.openocd_target,
-                                                                        self.openocd_target_state, new_target_pc))
-            if self.opt_autoread and self.ui.tabs_device.count():
-                if ((self.openocd_target_state == "halted") and (new_target_pc != self.openocd_target_pc)):
-                    self.ui.tabs_device.currentWidget().btn_readall.clicked.emit()
-            self.openocd_target_pc = new_target_pc
-
-        else:
-            self.openocd_rt.is_executing = False
-            self.disconnect_openocd()
+        # one status query per target, all targets at once; a failed query is the
+        # liveness check, lost connections are reopened by the pool; shadow caches
+        # are invalidated by the pool when the status shows the target has run
+        keys = self.openocd_pool.keys()
+        self.openocd_poll = self.openocd_bridge.call(self.openocd_pool.status_many_async(keys),
+                                                     lambda future: self.__show_status(keys, future))
+
+    def __show_status(self, keys, future):
+        if future is not self.openocd_poll:
+            # disconnected while the poll was on the way
+            return
+        status = []
+        changed = []
+        for key, result in zip(keys, future.result()):
+            old_state, old_pc, old_halts = self.openocd_status.get(key, (None, None, None))
+            if isinstance(result, Exception):
+                self.openocd_status[key] = (None, old_pc, old_halts)
+                status += ["%s | connection lost" % key]
+                continue
+            state, new_pc, halts = result
+            new_pc = old_pc if new_pc is None else new_pc
+            if state == "halted" and old_pc is not None and (new_pc, halts) != (old_pc, old_halts):
+                changed += [key]
+            self.openocd_status[key] = (state, new_pc, halts)
+            status += ["%s | %s | %s" % (key, state, "0x%08X" % new_pc if new_pc is not None else "-")]
+        self.ui.lab_status.setText("Connected: %s" % "; ".join(status))
+        if changed:
+            self.__read_on_halt(changed)
+        self.__adapt_poll_interval()
+
+    def __read_on_halt(self, targets):
+        # pinned registers of all tabs, and with autoread all registers of all tabs,
+        # of the halted targets go as one read, so a halt costs the same few round
+        # trips however many tabs are open
+        tabs = [tab for tab in self.__periph_tabs() if tab.target() in targets]
+        regs = [(tab, row) for tab in tabs
+                for row in (range(len(tab.model.regs)) if self.opt_autoread else sorted(tab.model.pinned))]
+        if regs:
+            self.read_regs(regs, "Read on halt %d registers" % len(regs), lazy=True)
+
+    def __adapt_poll_interval(self):
+        if not self.openocd_poll_timer.isActive():
+            return
+        running = all(status[0] == "running" for status in self.openocd_status.values())
+        idle = time.monotonic() - self.openocd_ui_time > OPENOCD_UI_IDLE
+        interval = self.openocd_poll_timer.interval() // 1000
+        interval = min(interval * 2, OPENOCD_POLL_MAX) if running and idle else OPENOCD_POLL_MIN
+        if interval * 1000 != self.openocd_poll_timer.interval():
+            self.openocd_poll_timer.setInterval(interval * 1000)
 
     def disconnect_openocd(self):
-        self.openocd_rt.stop()
-        while self.openocd_rt.is_executing:
-            pass
-        self.openocd_tn.close()
+        # pending writes are sent after the batch on the way, then connections are
+        # closed; returned future is done when all of it is
+        async def close(flush, writes, keys):
+            if flush:
+                await asyncio.wrap_future(flush)
+            await self.openocd_pool.write_many_async(writes)
+            await asyncio.gather(*[self.openocd_pool.close_async(key) for key in keys])
+        self.openocd_poll_timer.stop()
+        self.openocd_poll = None
+        self.openocd_write_timer.stop()
+        future = self.openocd_bridge.call(close(self.openocd_flush, self.openocd_writes.take(),
+                                                self.openocd_pool.keys()))
+        self.openocd_flush = None
+        self.openocd_status = {}
+        self.__update_tabs_targets()
         self.ui.act_connect.setText("Connect OpenOCD")
         self.ui.lab_status.setText("No connection")
+        return future
+
+    def __update_tabs_targets(self):
+        for tab_n in range(0, self.ui.tabs_device.count()):
+            self.ui.tabs_device.widget(tab_n).setTargets(self.__targets())
+
+    def __targets(self):
+        # connections of the pool are closed on the loop thread after disconnect
+        return self.openocd_pool.keys() if self.openocd_poll_timer.isActive() else []
 
 
 # -- Standalone run -----------------------------------------------------------
@@ -0,0 +1,127 @@
+#!/user/bin/env python3
+
+"""
+Plan register reads as the fewest block reads
+
+Run to see the cost of Read all for every peripheral of the SVD:
+    python3 read_plan.py %svd_file_path% [--gap N ...]
+"""
+
+import bisect
+
+
+# Registers not further than this many bytes apart are read with one block read
+DEFAULT_GAP = 16
+
+
+class ReadSpan:
+    """One block read of count 32-bit words from addr, covering items"""
+    __slots__ = ("addr", "count", "items")
+
+    def __init__(self, addr, count, items):
+        self.addr = addr
+        self.count = count
+        self.items = items
+
+    def values(self, words):
+        """Return (item, value) for every item from words read for the span"""
+        data = b"".join(word.to_bytes(4, "little") for word in words)
+        result = []
+        for item in self.items:
+            offset = item[0] - self.addr
+            result += [(item, int.from_bytes(data[offset:offset + _reg_bytes(item[1])], "little"))]
+        return result
+
+
+class ReadPlan:
+    def __init__(self, spans, skipped):
+        self.spans = spans
+        self.skipped = skipped
+
+    def round_trips(self):
+        return len(self.spans)
+
+    def bytes(self):
+        return sum(span.count * 4 for span in self.spans)
+
+
+def plan_reads(items, gap=DEFAULT_GAP, exclude=None):
+    """Merge registers into the fewest word aligned spans.
+
+    items are (addr, svd_reg, ...) tuples, the rest of a tuple is kept for the
+    caller. Registers are merged while the hole between them is not bigger
+    than gap bytes. Registers with read side effects or matched by exclude
+    predicate are skipped, and no span is allowed to grow over them. Words
+    touched by registers with read side effects are never read, so other
+    registers sharing such a word (alternate registers at one address) are
+    skipped too.
+    """
+    forbidden = sorted({word for item in items if item[1].has_read_side_effects()
+                        for word in range(*_words(item[0], item[0] + _reg_bytes(item[1])))})
+    spans = []
+    skipped = []
+    members = []
+    start = end = 0
+    for item in sorted(items, key=lambda item: item[0]):
+        addr, reg = item[0], item[1]
+        item_end = addr + _reg_bytes(reg)
+        excluded = exclude and exclude(reg)
+        if reg.has_read_side_effects() or excluded or _covers(forbidden, *_words(addr, item_end)[:2]):
+            skipped += [item]
+            if members and excluded:
+                spans += [_span(start, end, members)]
+                members = []
+            continue
+        if members and (addr - end > gap or _covers(forbidden, *_words(start, max(end, item_end))[:2])):
+            spans += [_span(start, end, members)]
+            members = []
+        if not members:
+            start = end = addr
+        members += [item]
+        end = max(end, item_end)
+    if members:
+        spans += [_span(start, end, members)]
+    return ReadPlan(spans, skipped)
+
+
+def _span(start, end, items):
+    addr = start & ~0x3
+    return ReadSpan(addr, (end - addr + 3) // 4, items)
+
+
+def _words(start, end):
+    # range of addresses of the words a span from start to end reads
+    return start & ~0x3, (end + 3) & ~0x3, 4
+
+
+def _covers(words, start, end):
+    # any of sorted words is in [start, end)
+    num = bisect.bisect_left(words, start)
+    return num < len(words) and words[num] < end
+
+
+def _reg_bytes(reg):
+    return max(reg.size // 8, 1)
+
+
+# -- Standalone run -----------------------------------------------------------
+if __name__ == "__main__":
+    import argparse
+    from svd import SVDReader
+
+    parser = argparse.ArgumentParser(description="Cost of Read all for every peripheral with different gaps")
+    parser.add_argument("path", help="SVD file")
+    parser.add_argument("--gap", type=int, nargs="+", default=[0, 4, 16, 64, 256],
+                        help="gap thresholds to compare, bytes (default: %(default)s)")
+    args = parser.parse_args()
+
+    svd_reader = SVDReader(backend="iterparse")
+    svd_reader.parse_path(args.path)
+    print("%6s %12s %12s %12s" % ("gap", "round trips", "bytes", "skipped"))
+    for gap in args.gap:
+        plans = [plan_reads([(periph.base_address + reg.address_offset, reg) for reg in periph.flat_regs()], gap)
+                 for periph in svd_reader.device]
+        print("%6d %12d %12d %12d" % (gap,
+                                      sum(plan.round_trips() for plan in plans),
+                                      sum(plan.bytes() for plan in plans),
+                                      sum(len(plan.skipped) for plan in plans)))
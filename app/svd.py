@@ -1,18 +1,194 @@
 #!/user/bin/env python3
 
 """
-Read SVD file with cmsic-svd backend
+Read SVD file with cmsic-svd backend or with streaming iterparse backend
 """
 
 import os
-from operator import itemgetter
+import re
+import sys
+import bisect
+import functools
+import threading
+from operator import attrgetter
+from xml.etree import ElementTree as ET
 import cmsis_svd
 from cmsis_svd.parser import SVDParser
 
 
+BACKENDS = ("cmsis", "iterparse")
+
+
+# -- Device model -------------------------------------------------------------
+class SVDItem:
+    """Read-only slotted record with dict-compatible view (item["name"], keys(), ...)"""
+    __slots__ = _keys = ()
+    type = None
+
+    def __init__(self, *values):
+        for key, value in zip(self._keys, values):
+            object.__setattr__(self, key, sys.intern(value) if key in _INTERNED and value else value)
+
+    def __setattr__(self, key, value):
+        raise AttributeError("%s is read-only" % self.__class__.__name__)
+
+    def __reduce__(self):
+        return (self.__class__, tuple(getattr(self, key) for key in self._keys))
+
+    def __eq__(self, other):
+        return (isinstance(other, SVDItem) and self.type == other.type and
+                all(getattr(self, key) == getattr(other, key) for key in self._keys))
+
+    __hash__ = None
+
+    def __repr__(self):
+        return "%s(%s)" % (self.__class__.__name__, self.name)
+
+    def __getitem__(self, key):
+        if key == "type":
+            return self.type
+        if key in self._keys:
+            return getattr(self, key)
+        raise KeyError(key)
+
+    def __contains__(self, key):
+        return key == "type" or key in self._keys
+
+    def get(self, key, default=None):
+        return self[key] if key in self else default
+
+    def keys(self):
+        return ("type",) + self._keys
+
+    def values(self):
+        return [self[key] for key in self.keys()]
+
+    def items(self):
+        return [(key, self[key]) for key in self.keys()]
+
+    def replace(self, **changes):
+        return self.__class__(*(changes[key] if key in changes else getattr(self, key) for key in self._keys))
+
+
+class SVDEnum(SVDItem):
+    __slots__ = _keys = ("name", "description", "value")
+    type = "enum"
+
+
+class SVDField(SVDItem):
+    __slots__ = _keys = ("name", "description", "address_offset", "lsb", "msb", "access", "read_action",
+                         "derived_from", "enums")
+    type = "field"
+
+
+class SVDReg(SVDItem):
+    __slots__ = _keys = ("name", "description", "address_offset", "size", "access", "read_action", "derived_from",
+                         "fields")
+    type = "reg"
+
+    def has_read_side_effects(self):
+        """Reading the register changes it or something else (readAction of register or any field)"""
+        return bool(self.read_action) or any(field.read_action for field in self.fields)
+
+    def is_volatile(self):
+        """Value may change while the core is halted - read side effects or
+        read-only register or fields, which are status updated by hardware"""
+        return (self.has_read_side_effects() or self.access == "read-only" or
+                any(field.access == "read-only" for field in self.fields))
+
+
+class SVDRegArray(SVDReg):
+    """Register array kept as one template register plus stride and count.
+
+    name is the dim pattern (e.g. "BUF%s" or "CH[%s].CCR"), address_offset and
+    fields belong to the first instance. Instances are created on demand.
+    """
+    __slots__ = ("dim_increment", "dim_index")
+    _keys = SVDReg._keys + __slots__
+    type = "reg_array"
+
+    @property
+    def dim(self):
+        return len(self.dim_index)
+
+    def instance_name(self, num):
+        return self.name % self.dim_index[num]
+
+    def instance(self, num):
+        address_offset = self.address_offset + self.dim_increment * num
+        return SVDReg(self.instance_name(num),
+                      self.description,
+                      address_offset,
+                      self.size,
+                      self.access,
+                      self.read_action,
+                      self.derived_from,
+                      tuple(field.replace(address_offset=address_offset) for field in self.fields))
+
+    def instances(self):
+        return [self.instance(num) for num in range(self.dim)]
+
+    def span(self):
+        """Return (address_offset, byte size) covered by all instances"""
+        return (self.address_offset, self.dim_increment * (self.dim - 1) + max(self.size // 8, 1))
+
+
+class SVDPeriph(SVDItem):
+    __slots__ = _keys = ("name", "description", "base_address", "group_name", "derived_from", "regs")
+    type = "periph"
+
+    def flat_regs(self):
+        """Registers with every array expanded to instances, sorted by address"""
+        regs = []
+        for reg in self.regs:
+            regs += reg.instances() if isinstance(reg, SVDRegArray) else [reg]
+        return sorted(regs, key=attrgetter('address_offset'))
+
+
+class SVDLazyPeriph(SVDPeriph):
+    """Peripheral which registers are parsed on first access to regs"""
+    __slots__ = ("loader",)
+
+    def __init__(self, *values, loader=None):
+        SVDPeriph.__init__(self, *values[:-1])
+        _periph_regs.__set__(self, values[-1])
+        object.__setattr__(self, "loader", loader)
+
+    @property
+    def regs(self):
+        # loader is taken first: it is dropped only after regs are set, so a
+        # thread racing with the first load either gets regs or a loader
+        loader = self.loader
+        regs = _periph_regs.__get__(self)
+        if regs is None:
+            regs = loader()
+            _periph_regs.__set__(self, regs)
+            object.__setattr__(self, "loader", None)
+        return regs
+
+    def is_loaded(self):
+        return _periph_regs.__get__(self) is not None
+
+    def __reduce__(self):
+        return (SVDPeriph, tuple(getattr(self, key) for key in self._keys))
+
+
+_periph_regs = SVDPeriph.__dict__["regs"]
+_INTERNED = {"name", "group_name", "access", "read_action", "derived_from"}
+
+
+class SVDCancelled(Exception):
+    pass
+
+
 class SVDReader:
-    def __init__(self):
+    def __init__(self, cache=None, backend="cmsis", lazy=False):
+        if backend not in BACKENDS:
+            raise ValueError("Unknown SVD backend '%s'" % backend)
         self.device = []
+        self.cache = cache
+        self.backend = backend
+        self.lazy = lazy
 
     def get_packed_list(self):
         packed = []
@@ -25,55 +201,633 @@ class SVDReader:
                         "filenames": sorted(filenames)}]
         return sorted(packed, key=lambda k: k['vendor'])
 
-    def parse_path(self, path):
-        self.__fill_device([periph for periph in SVDParser.for_xml_file(path).get_device().peripherals])
+    def parse_path(self, path, progress=None, cancel=None):
+        # progress(periph, done, total) is called for every peripheral as soon as it is ready,
+        # setting cancel event from the other thread stops parsing with SVDCancelled;
+        # lazy mode takes a cached device too (prewarmed or parsed in full before),
+        # but stores nothing - its registers are parsed on first access
+        if self.cache:
+            device = self.cache.load(path)
+            if device is not None:
+                for num, periph in enumerate(device if progress else []):
+                    progress(periph, num + 1, len(device))
+                self.device = device
+                return
+        if self.lazy:
+            headers = self.__index_headers(path)
+            total = len(headers)
+            resolver = _DerivedResolver(headers, self.__load_regs)
+        else:
+            if self.backend == "iterparse":
+                headers = self.__iterparse_headers(path)
+            else:
+                headers = self.__cmsis_headers(path)
+            total = self.__count_periphs(path) if progress else 0
+            resolver = _DerivedResolver(headers)
+        self.device = resolver.device(progress, cancel, total)
+        if self.cache and not self.lazy:
+            self.cache.store(path, self.device)
 
-    def parse_packed(self, vendor, filename):
-        self.parse_path(os.path.join(cmsis_svd.__path__[0], "data", vendor, filename))
+    def parse_packed(self, vendor, filename, progress=None, cancel=None):
+        self.parse_path(self.packed_path(vendor, filename), progress, cancel)
 
-    def __fill_device(self, peripherals):
-        # Read peripherals and their registers
-        self.device = []
-        for periph in peripherals:
-            self.device += [{"type": "periph",
-                             "name": periph.name,
-                             "description": self.__item_description(periph),
-                             "base_address": periph.base_address,
-                             "group_name": periph.group_name,
-                             "regs": periph.derived_from}]  # regs value will be replaced with regs list
-            if (self.device[-1]["regs"] is not None):
-                    self.device[-1]["regs"] = next(periph for periph in self.device if periph["name"] == self.device[-1]["regs"])["regs"].copy()
-            else:
-                self.device[-1]["regs"] = []
-                for reg in periph.registers:
-                    self.device[-1]["regs"] += [{"type": "reg",
-                                                 "name": reg.name,
-                                                 "description": self.__item_description(reg),
-                                                 "address_offset": reg.address_offset,
-                                                 "fields": []}]
+    def packed_path(self, vendor, filename):
+        return os.path.join(cmsis_svd.__path__[0], "data", vendor, filename)
+
+    def get_summary(self, path):
+        # quick look at the file without XML parsing: device and cpu names, number of peripherals
+        with open(path, "rb") as f:
+            data = _XML_COMMENT.sub(b"", f.read())
+        periphs_start = data.find(b"<peripherals")
+        head = data[:periphs_start] if periphs_start != -1 else data
+        device = _SUMMARY_DEVICE.search(head)
+        cpu = _SUMMARY_CPU.search(head)
+        return {"device": device.group(1).decode(errors="replace").strip() if device else "",
+                "cpu": cpu.group(1).decode(errors="replace").strip() if cpu else "",
+                "periphs": len(_PERIPH_START.findall(data)),
+                "size": os.path.getsize(path)}
+
+    def __count_periphs(self, path):
+        with open(path, "rb") as f:
+            data = f.read()
+        return len(_PERIPH_START.findall(_XML_COMMENT.sub(b"", data)))
+
+    # -- cmsis-svd backend --
+    # cmsis-svd reads derivedFrom of registers and fields from a child element
+    # instead of the attribute, so only peripherals can be derived here. Access is
+    # inherited from device by cmsis-svd, but not by registers of arrays.
+    def __cmsis_headers(self, path):
+        for periph in SVDParser.for_xml_file(path).get_device().peripherals:
+            headers = [{"name": periph.name,
+                         "derived_from": periph.derived_from,
+                         "description": periph.description,
+                         "base_address": periph.base_address,
+                         "group_name": periph.group_name,
+                         "size": periph.size,
+                         "access": periph.access,
+                         "device_size": None,
+                         "device_access": None,
+                         "regs": None}]
+            if periph.derived_from is None:
+                headers[-1]["regs"] = []
+                # plain registers and arrays are taken separately to keep arrays compact
+                for reg in (periph._registers or []) + (periph.register_arrays or []):
+                    dim_index = getattr(reg, "dim_indices", None)
+                    headers[-1]["regs"] += [{"name": reg.name,
+                                             "derived_from": reg.derived_from,
+                                             "description": reg.description,
+                                             "address_offset": reg.address_offset,
+                                             "size": reg.size,
+                                             "access": reg.access,
+                                             "read_action": reg.read_action,
+                                             "dim_increment": getattr(reg, "dim_increment", None),
+                                             "dim_index": tuple(str(i) for i in dim_index) if dim_index else None,
+                                             "fields": []}]
                     for field in reg.fields:
-                        self.device[-1]["regs"][-1]["fields"] += [{"type": "field",
-                                                                   "name": field.name,
-                                                                   "description": self.__item_description(field),
-                                                                   "address_offset": reg.address_offset,
-                                                                   "lsb": field.bit_offset,
-                                                                   "msb": field.bit_offset + field.bit_width - 1,
-                                                                   "access": field.access,
-                                                                   "enums": None}]
+                        headers[-1]["regs"][-1]["fields"] += [{"name": field.name,
+                                                               "derived_from": field.derived_from,
+                                                               "description": field.description,
+                                                               "lsb": field.bit_offset,
+                                                               "width": field.bit_width,
+                                                               "access": field.access,
+                                                               "read_action": field.read_action,
+                                                               "enums": None}]
                         if field.enumerated_values:
-                            self.device[-1]["regs"][-1]["fields"][-1]["enums"] = []
+                            headers[-1]["regs"][-1]["fields"][-1]["enums"] = []
                             for enum in field.enumerated_values:
-                                self.device[-1]["regs"][-1]["fields"][-1]["enums"] += [{"name": enum.name,
-                                                                                        "description": self.__item_description(enum),
-                                                                                        "value": enum.value}]
-            self.device[-1]["regs"] = sorted(self.device[-1]["regs"], key=itemgetter('address_offset'))
-        self.device = sorted(self.device, key=itemgetter('base_address'))
-
-    def __item_description(self, item):
-        if item.description:
-            return ' '.join(item.description.replace("\n", " ").split())
+                                description = _description(enum.description)
+                                headers[-1]["regs"][-1]["fields"][-1]["enums"] += [{"name": enum.name,
+                                                                                    "description": description,
+                                                                                    "value": enum.value}]
+            yield headers[-1]
+
+    # -- Iterparse backend --
+    # Streams the XML and builds the same records as cmsis-svd backend directly
+    # from every <peripheral> element, which is freed as soon as it is read.
+    def __iterparse_headers(self, path):
+        depth = 0
+        device_size = None
+        device_access = None
+        for event, node in ET.iterparse(path, events=("start", "end")):
+            if event == "start":
+                depth += 1
+                continue
+            if depth == 2 and node.tag == "size":
+                device_size = _svd_int(node.text)
+            elif depth == 2 and node.tag == "access":
+                device_access = node.text.strip() if node.text else None
+            elif node.tag == "peripheral":
+                header = self.__read_periph(node)
+                header["device_size"] = device_size
+                header["device_access"] = device_access
+                yield header
+                node.clear()
+            depth -= 1
+
+    # -- Lazy mode --
+    # Only peripheral headers are parsed at open, every peripheral remembers
+    # its byte span in the file and registers are parsed from it on demand.
+    def __index_headers(self, path):
+        with open(path, "rb") as f:
+            data = f.read()
+        # blank out comments keeping offsets, they may contain peripheral tags
+        data = _XML_COMMENT.sub(lambda m: b" " * len(m.group(0)), data)
+        starts = [m.start() for m in _PERIPH_START.finditer(data)]
+        ends = [m.end() for m in _PERIPH_END.finditer(data)]
+        if not starts or len(starts) != len(ends) or any(start > end for start, end in zip(starts, ends)):
+            # peripheral tags are hidden in CDATA or namespaced - fall back to full parsing
+            return list(self.__iterparse_headers(path))
+        declaration = _XML_DECLARATION.match(data)
+        declaration = declaration.group(0) if declaration else b""
+        device_size = _SUMMARY_SIZE.search(data, 0, starts[0])
+        device_size = _svd_int(device_size.group(1).decode()) if device_size else None
+        device_access = _SUMMARY_ACCESS.search(data, 0, starts[0])
+        device_access = device_access.group(1).decode().strip() if device_access else None
+        headers = []
+        for start, end in zip(starts, ends):
+            regs_start = data.find(b"<registers", start, end)
+            header_end = regs_start if regs_start != -1 else end - len(b"</peripheral>")
+            node = ET.fromstring(declaration + data[start:header_end] + b"</peripheral>")
+            headers += [self.__read_periph(node)]
+            headers[-1]["regs"] = None if regs_start == -1 else _LAZY
+            headers[-1]["device_size"] = device_size
+            headers[-1]["device_access"] = device_access
+            headers[-1]["span"] = (path, declaration, start, end)
+        return headers
+
+    def __load_regs(self, header):
+        path, declaration, start, end = header["span"]
+        with open(path, "rb") as f:
+            f.seek(start)
+            node = ET.fromstring(declaration + f.read(end - start))
+        return self.__read_periph(node)["regs"]
+
+    def __read_periph(self, node):
+        regs = None
+        regs_node = node.find("registers")
+        if regs_node is not None:
+            regs = []
+            arrays = []
+            for reg_node in regs_node.findall("register"):
+                if _node_int(reg_node, "dim") is None:
+                    regs += [self.__read_reg(reg_node)]
+                else:
+                    arrays += [self.__read_reg(reg_node)]
+            regs += arrays
+            for cluster_node in regs_node.findall("cluster"):
+                regs += self.__read_cluster(cluster_node)
+        return {"name": _node_text(node, "name"),
+                "derived_from": node.get("derivedFrom"),
+                "description": _node_text(node, "description"),
+                "base_address": _node_int(node, "baseAddress"),
+                "group_name": _node_text(node, "groupName"),
+                "size": _node_int(node, "size"),
+                "access": _node_text(node, "access"),
+                "regs": regs}
+
+    def __read_reg(self, node):
+        fields = None
+        for field_node in node.iter("field"):
+            fields = [] if fields is None else fields
+            name = _node_text(field_node, "name")
+            if "reserved" not in name.lower():
+                fields += [self.__read_field(field_node)]
+
+        dim_increment, dim_index = self.__read_dim(node)
+        return {"name": _node_text(node, "name"),
+                "derived_from": node.get("derivedFrom"),
+                "description": _node_text(node, "description"),
+                "address_offset": _node_int(node, "addressOffset"),
+                "size": _node_int(node, "size"),
+                "access": _node_text(node, "access"),
+                "read_action": _node_text(node, "readAction"),
+                "dim_increment": dim_increment,
+                "dim_index": dim_index,
+                "fields": fields}
+
+    def __read_cluster(self, node, prefix="", offset=0, access=None):
+        # clusters are flattened to registers named CLUSTER.REG, cluster array is
+        # kept compact by making every register inside an array with cluster stride
+        name = prefix + _node_text(node, "name")
+        offset += _node_int(node, "addressOffset") or 0
+        access = _node_text(node, "access") or access
+        dim_increment, dim_index = self.__read_dim(node)
+        regs = []
+        for reg_node in node.findall("register"):
+            regs += [self.__read_reg(reg_node)]
+            regs[-1]["access"] = regs[-1]["access"] or access
+        nested = node.findall("cluster")
+        if dim_index and (nested or any(reg["dim_index"] for reg in regs)):
+            # array of arrays can't be kept as one template - expand the outer one
+            result = []
+            for num, index in enumerate(dim_index):
+                result += self.__flat_cluster(regs, nested, name % index, offset + dim_increment * num, access)
+            return result
+        result = self.__flat_cluster(regs, nested, name, offset, access)
+        if dim_index:
+            for reg in result[:len(regs)]:
+                reg["dim_increment"] = dim_increment
+                reg["dim_index"] = dim_index
+        return result
+
+    def __flat_cluster(self, regs, nested, name, offset, access):
+        result = []
+        for reg in regs:
+            # derivedFrom of a sibling register inside the cluster gets the same prefix
+            derived_from = reg["derived_from"]
+            if derived_from and any(sibling["name"] == derived_from for sibling in regs):
+                derived_from = "%s.%s" % (name, derived_from)
+            result += [dict(reg,
+                            name="%s.%s" % (name, reg["name"]),
+                            derived_from=derived_from,
+                            address_offset=reg["address_offset"] + offset)]
+        for cluster_node in nested:
+            result += self.__read_cluster(cluster_node, name + ".", offset, access)
+        return result
+
+    def __read_dim(self, node):
+        dim = _node_int(node, "dim")
+        if dim is None:
+            return (None, None)
+        dim_index = _dim_indices(dim, _node_text(node, "dimIndex"))
+        return (_node_int(node, "dimIncrement"), tuple(str(index) for index in dim_index))
+
+    def __read_field(self, node):
+        bit_offset = _node_int(node, "bitOffset")
+        bit_width = _node_int(node, "bitWidth")
+        bit_range = _node_text(node, "bitRange")
+        msb = _node_int(node, "msb")
+        lsb = _node_int(node, "lsb")
+        if bit_range is not None:
+            m = re.search(r"\[([0-9]+):([0-9]+)\]", bit_range)
+            bit_offset = int(m.group(2))
+            bit_width = 1 + (int(m.group(1)) - int(m.group(2)))
+        elif msb is not None:
+            bit_offset = lsb
+            bit_width = 1 + (msb - lsb)
+
+        enums = []
+        for enum_node in node.findall("./enumeratedValues/enumeratedValue"):
+            enums += [{"name": _node_text(enum_node, "name"),
+                       "description": _description(_node_text(enum_node, "description")),
+                       "value": _node_int(enum_node, "value")}]
+        return {"name": _node_text(node, "name"),
+                "derived_from": node.get("derivedFrom"),
+                "description": _node_text(node, "description"),
+                "lsb": bit_offset,
+                "width": bit_width,
+                "access": _node_text(node, "access"),
+                "read_action": _node_text(node, "readAction"),
+                "enums": enums if enums else None}
+
+
+# -- derivedFrom resolution ---------------------------------------------------
+class _DerivedResolver:
+    """Two-pass derivedFrom resolution over backend peripheral headers.
+
+    First pass indexes peripherals by name, second pass resolves every item
+    through the index, so base may follow derived item in the file. Derived
+    peripherals without own registers share the register tuple of the base
+    one - register records are never modified after resolution. In lazy mode
+    registers are resolved by the thread which first accesses them, maybe
+    while device() still runs in the other one, so state is guarded by lock.
+    """
+
+    def __init__(self, headers, loader=None):
+        self.headers = headers
+        self.loader = loader
+        self.lock = threading.RLock()
+        self.periphs = {}
+        self.resolved = {}
+        self.resolving = set()
+        self.enum_tuples = {}
+
+    def device(self, progress=None, cancel=None, total=0):
+        # headers may be streamed: peripheral is resolved as soon as everything it
+        # refers to is indexed, the rest is resolved when all headers are read
+        device = []
+        pending = []
+        for header in self.headers:
+            if cancel and cancel.is_set():
+                raise SVDCancelled()
+            with self.lock:
+                self.periphs.setdefault(header["name"], header)
+                if not self.is_ready(header):
+                    pending += [header]
+                    continue
+                device += [self.periph(header)]
+            if progress:
+                progress(device[-1], len(device), max(total, len(device)))
+        for header in pending:
+            if cancel and cancel.is_set():
+                raise SVDCancelled()
+            with self.lock:
+                device += [self.periph(header)]
+            if progress:
+                progress(device[-1], len(device), max(total, len(device)))
+        return sorted(device, key=attrgetter('base_address'))
+
+    def is_ready(self, header, stack=frozenset()):
+        if header["name"] in stack:
+            return False
+        refs = {header["derived_from"]} if header["derived_from"] else set()
+        if isinstance(header["regs"], list):
+            for reg in header["regs"]:
+                if reg["derived_from"] and "." in reg["derived_from"]:
+                    refs.add(reg["derived_from"].rsplit(".", 1)[0])
+                for field in reg["fields"] or ():
+                    if field["derived_from"] and field["derived_from"].count(".") == 2:
+                        refs.add(field["derived_from"].split(".")[0])
+        refs.discard(header["name"])
+        stack = stack | {header["name"]}
+        return all(ref in self.periphs and self.is_ready(self.periphs[ref], stack) for ref in refs)
+
+    def periph(self, header):
+        if id(header) in self.resolved:
+            return self.resolved[id(header)]
+        if id(header) in self.resolving:
+            raise ValueError("Circular derivedFrom for peripheral %s" % header["name"])
+        self.resolving.add(id(header))
+
+        base = self.periphs.get(header["derived_from"]) if header["derived_from"] else None
+        base = self.periph(base) if base else None
+        values = dict(header)
+        if base:
+            for key in ("description", "base_address", "group_name"):
+                if values[key] is None:
+                    values[key] = getattr(base, key)
+        # default register size and access are inherited from base peripheral or device
+        if header["size"]:
+            header["default_size"] = header["size"]
+        elif base:
+            header["default_size"] = self.periphs[header["derived_from"]]["default_size"]
         else:
-            return "No description"
+            header["default_size"] = header["device_size"] or 32
+        if header["access"]:
+            header["default_access"] = header["access"]
+        elif base:
+            header["default_access"] = self.periphs[header["derived_from"]]["default_access"]
+        else:
+            header["default_access"] = header["device_access"]
+        values = (values["name"],
+                  _description(values["description"]),
+                  values["base_address"],
+                  values["group_name"],
+                  values["derived_from"])
+        if self.loader:
+            periph = SVDLazyPeriph(*values, None, loader=functools.partial(self.periph_regs, header, base))
+        else:
+            periph = SVDPeriph(*values, self.periph_regs(header, base))
+
+        self.resolving.discard(id(header))
+        self.resolved[id(header)] = periph
+        return periph
+
+    def periph_regs(self, header, base):
+        with self.lock:
+            if header["regs"] is None:
+                return base.regs if base else ()
+            regs = self.regs(header)
+            if base:
+                names = {reg.name for reg in regs}
+                regs = [reg for reg in base.regs if reg.name not in names] + regs
+            return tuple(sorted(regs, key=attrgetter('address_offset')))
+
+    def raw_regs(self, header):
+        if header["regs"] is _LAZY:
+            header["regs"] = self.loader(header)
+        return header["regs"]
+
+    def regs(self, header):
+        # registers and fields can be derived by name inside the scope or by full dotted path
+        by_name = {}
+        for reg in self.raw_regs(header):
+            by_name.setdefault(reg["name"], reg)
+            for index in reg["dim_index"] or ():
+                by_name.setdefault(reg["name"] % index, reg)
+        resolved = {}
+        return [self.reg(header, reg, by_name, resolved, set()) for reg in header["regs"]]
+
+    def reg(self, header, raw, by_name, resolved, resolving):
+        if id(raw) in resolved:
+            return resolved[id(raw)]
+        if id(raw) in resolving:
+            raise ValueError("Circular derivedFrom for register %s.%s" % (header["name"], raw["name"]))
+        resolving.add(id(raw))
+
+        base = None
+        if raw["derived_from"]:
+            if raw["derived_from"] in by_name:
+                base = self.reg(header, by_name[raw["derived_from"]], by_name, resolved, resolving)
+            elif "." in raw["derived_from"]:
+                periph_name, reg_name = raw["derived_from"].rsplit(".", 1)
+                if periph_name in self.periphs:
+                    base = next((reg for reg in self.periph(self.periphs[periph_name]).regs
+                                 if reg.name == reg_name or
+                                 (isinstance(reg, SVDRegArray) and
+                                  reg_name in map(reg.instance_name, range(reg.dim)))), None)
+
+        description = raw["description"]
+        if base and description is None:
+            description = base.description
+        size = raw["size"]
+        if size is None:
+            size = base.size if base else header["default_size"]
+        access = raw["access"]
+        if access is None:
+            access = base.access if base else header["default_access"]
+        read_action = raw["read_action"]
+        if base and read_action is None:
+            read_action = base.read_action
+        fields = ()
+        if raw["fields"] is None or (base and not raw["fields"]):
+            if base:
+                fields = tuple(field.replace(address_offset=raw["address_offset"]) for field in base.fields)
+        else:
+            fields = self.fields(header, raw, access)
+        values = (raw["name"],
+                  _description(description),
+                  raw["address_offset"],
+                  size,
+                  access,
+                  read_action,
+                  raw["derived_from"],
+                  fields)
+        if raw["dim_index"]:
+            reg = SVDRegArray(*values, raw["dim_increment"], raw["dim_index"])
+        else:
+            reg = SVDReg(*values)
+
+        resolving.discard(id(raw))
+        resolved[id(raw)] = reg
+        return reg
+
+    def fields(self, header, raw_reg, access):
+        by_name = {}
+        for field in raw_reg["fields"]:
+            by_name.setdefault(field["name"], field)
+        fields = []
+        for raw in raw_reg["fields"]:
+            visited = set()
+            base = raw
+            values = dict(raw)
+            while base["derived_from"] and id(base) not in visited:
+                visited.add(id(base))
+                base = by_name.get(base["derived_from"]) or self.__dotted_field(header, base["derived_from"])
+                if base is None:
+                    break
+                for key in ("description", "lsb", "width", "access", "read_action", "enums"):
+                    if values[key] is None:
+                        values[key] = base[key]
+            # field without own access has the one of its register
+            fields += [SVDField(values["name"],
+                                _description(values["description"]),
+                                raw_reg["address_offset"],
+                                values["lsb"],
+                                values["lsb"] + values["width"] - 1,
+                                values["access"] or access,
+                                values["read_action"],
+                                values["derived_from"],
+                                self.enums(values["enums"]))]
+        return tuple(fields)
+
+    def enums(self, raw_enums):
+        # array instances and derived fields keep sharing one enums tuple
+        if not raw_enums:
+            return None
+        if id(raw_enums) not in self.enum_tuples:
+            self.enum_tuples[id(raw_enums)] = tuple(SVDEnum(enum["name"], enum["description"], enum["value"])
+                                                    for enum in raw_enums)
+        return self.enum_tuples[id(raw_enums)]
+
+    def __dotted_field(self, header, path):
+        # REG.FIELD inside current peripheral or PERIPH.REG.FIELD
+        path = path.split(".")
+        if len(path) == 2:
+            scope = header
+        elif len(path) == 3 and path[0] in self.periphs:
+            scope = self.periphs[path[0]]
+        else:
+            return None
+        raw_reg = next((reg for reg in self.raw_regs(scope) or () if reg["name"] == path[-2]), None)
+        if raw_reg is None:
+            return None
+        return next((field for field in raw_reg["fields"] or () if field["name"] == path[-1]), None)
+
+
+# -- Address lookup -----------------------------------------------------------
+class SVDAddressMap:
+    """Reverse lookup of absolute address to peripheral, register and fields.
+
+    Register spans are kept sorted by start address, so a lookup is a binary
+    search plus a short scan back over registers which may still cover the
+    address (never further than the largest span). Register array is one span,
+    the instance is computed from the stride. Registers of every lazy
+    peripheral are parsed to build it, setting cancel event from the other
+    thread stops that with SVDCancelled.
+    """
+
+    def __init__(self, device, cancel=None):
+        spans = []
+        for periph in device:
+            if cancel and cancel.is_set():
+                raise SVDCancelled()
+            for reg in periph.regs:
+                start = periph.base_address + reg.address_offset
+                if isinstance(reg, SVDRegArray):
+                    spans += [(start, start + reg.span()[1], periph, reg)]
+                else:
+                    spans += [(start, start + max(reg.size // 8, 1), periph, reg)]
+        spans.sort(key=lambda span: (span[0], -span[1]))
+        self.starts = [span[0] for span in spans]
+        self.ends = [span[1] for span in spans]
+        self.items = [(span[2], span[3]) for span in spans]
+        self.max_span = max((end - start for start, end in zip(self.starts, self.ends)), default=0)
+
+    def lookup(self, addr):
+        """Return (periph, reg, fields) for the address or None, fields are
+        the ones with bits inside the addressed byte"""
+        i = bisect.bisect_right(self.starts, addr) - 1
+        while i >= 0 and addr - self.starts[i] < self.max_span:
+            if addr < self.ends[i]:
+                periph, reg = self.items[i]
+                offset = addr - self.starts[i]
+                if isinstance(reg, SVDRegArray):
+                    num, offset = divmod(offset, reg.dim_increment)
+                    if offset >= max(reg.size // 8, 1):
+                        # gap between instances
+                        i -= 1
+                        continue
+                    reg = reg.instance(num)
+                lsb = offset * 8
+                fields = tuple(field for field in reg.fields if field.lsb < lsb + 8 and field.msb >= lsb)
+                return (periph, reg, fields)
+            i -= 1
+        return None
+
+    def lookup_many(self, addrs):
+        return [self.lookup(addr) for addr in addrs]
+
+
+# -- Helpers ------------------------------------------------------------------
+_LAZY = object()
+_PERIPH_START = re.compile(rb"<peripheral[\s>]")
+_PERIPH_END = re.compile(rb"</peripheral\s*>")
+_XML_COMMENT = re.compile(rb"<!--.*?-->", re.DOTALL)
+_SUMMARY_DEVICE = re.compile(rb"<device\b[^>]*>.*?<name>([^<]*)</name>", re.DOTALL)
+_SUMMARY_SIZE = re.compile(rb"<size>([^<]*)</size>")
+_SUMMARY_ACCESS = re.compile(rb"<access>([^<]*)</access>")
+_SUMMARY_CPU = re.compile(rb"<cpu>\s*<name>([^<]*)</name>")
+_XML_DECLARATION = re.compile(rb"\s*<\?xml[^>]*\?>")
+
+
+def _description(text):
+    if text:
+        return ' '.join(text.replace("\n", " ").split())
+    else:
+        return "No description"
+
+
+def _node_text(node, tag):
+    child = node.find(tag)
+    return None if child is None else child.text
+
+
+def _node_int(node, tag):
+    return _svd_int(_node_text(node, tag))
+
+
+def _svd_int(text):
+    # same conversion rules as cmsis-svd has for scaledNonNegativeInteger
+    if text is None:
+        return None
+    text = text.strip().lower()
+    try:
+        if text.startswith("0x"):
+            return int(text[2:], 16)
+        elif text.startswith("#"):
+            text = text.replace("x", "0")[1:]
+            return int(text, 2) if all(x in "01" for x in text) else int(text)
+        elif text.startswith("true"):
+            return 1
+        elif text.startswith("false"):
+            return 0
+        else:
+            return int(text)
+    except ValueError:
+        return None
+
+
+def _dim_indices(dim, dim_index):
+    if dim_index is None:
+        return range(0, dim)
+    elif "," in dim_index:
+        return dim_index.split(",")
+    elif "-" in dim_index:
+        m = re.search(r"([0-9]+)-([0-9]+)", dim_index)
+        return range(int(m.group(1)), int(m.group(2)) + 1)
+    else:
+        raise ValueError("Unexpected dimIndex: %r" % dim_index)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,121 @@
+#!/user/bin/env python3
+
+"""
+Persistent on-disk cache of parsed SVD devices
+"""
+
+import os
+import pickle
+import hashlib
+import zlib
+
+
+# Bump when the layout of SVDReader.device changes, so stale entries are ignored
+CACHE_FORMAT = 7
+# Size limit of the cache, bytes, least recently used entries are evicted above it
+DEFAULT_MAX_SIZE = 256 * 1024 * 1024
+
+
+def default_cache_dir():
+    if os.name == "nt":
+        base = os.environ.get("LOCALAPPDATA", os.path.expanduser("~"))
+    else:
+        base = os.environ.get("XDG_CACHE_HOME", os.path.join(os.path.expanduser("~"), ".cache"))
+    return os.path.join(base, "openocd-svd")
+
+
+class SVDCache:
+    def __init__(self, path=None, max_size=DEFAULT_MAX_SIZE):
+        self.path = path if path else default_cache_dir()
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+
+    def key(self, svd_path):
+        svd_path = os.path.abspath(svd_path)
+        stat = os.stat(svd_path)
+        content_hash = hashlib.sha1()
+        with open(svd_path, "rb") as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b""):
+                content_hash.update(chunk)
+        key = "%d|%s|%d|%d|%s" % (CACHE_FORMAT, svd_path, stat.st_size, stat.st_mtime_ns, content_hash.hexdigest())
+        return hashlib.sha1(key.encode()).hexdigest()
+
+    def load(self, svd_path):
+        entry_path = self.__entry_path(self.key(svd_path))
+        try:
+            with open(entry_path, "rb") as f:
+                device = pickle.loads(zlib.decompress(f.read()))
+        except (OSError, EOFError, zlib.error, pickle.UnpicklingError, AttributeError, ImportError):
+            self.misses += 1
+            return None
+        # touch entry to keep LRU order by access time
+        try:
+            os.utime(entry_path)
+        except OSError:
+            pass
+        self.hits += 1
+        return device
+
+    def store(self, svd_path, device):
+        # cache is best effort - parsing must not fail because of unwritable cache
+        try:
+            os.makedirs(self.path, exist_ok=True)
+            entry_path = self.__entry_path(self.key(svd_path))
+            tmp_path = "%s.%d.tmp" % (entry_path, os.getpid())
+            with open(tmp_path, "wb") as f:
+                f.write(zlib.compress(pickle.dumps(device, pickle.HIGHEST_PROTOCOL)))
+            os.replace(tmp_path, entry_path)
+            self.evict()
+            return True
+        except OSError:
+            return False
+
+    def entries(self):
+        try:
+            names = [n for n in os.listdir(self.path) if n.endswith(".svdc")]
+        except FileNotFoundError:
+            return []
+        entries = []
+        for name in names:
+            try:
+                stat = os.stat(os.path.join(self.path, name))
+            except FileNotFoundError:
+                continue
+            entries += [{"name": name,
+                         "size": stat.st_size,
+                         "mtime": stat.st_mtime}]
+        return sorted(entries, key=lambda k: k["mtime"])
+
+    def size(self):
+        return sum(entry["size"] for entry in self.entries())
+
+    def evict(self):
+        # drop least recently used entries until the cache fits into max_size
+        entries = self.entries()
+        total = sum(entry["size"] for entry in entries)
+        for entry in entries:
+            if total <= self.max_size:
+                break
+            try:
+                os.remove(os.path.join(self.path, entry["name"]))
+            except FileNotFoundError:
+                pass
+            total -= entry["size"]
+
+    def clear(self):
+        for entry in self.entries():
+            try:
+                os.remove(os.path.join(self.path, entry["name"]))
+            except FileNotFoundError:
+                pass
+        self.hits = 0
+        self.misses = 0
+
+    def __entry_path(self, key):
+        return os.path.join(self.path, key + ".svdc")
+
+
+if __name__ == "__main__":
+    svd_cache = SVDCache()
+    print("%s: %d entries, %d bytes" % (svd_cache.path, len(svd_cache.entries()), svd_cache.size()))
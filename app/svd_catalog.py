@@ -0,0 +1,103 @@
+#!/user/bin/env python3
+
+"""
+Persistent catalog of SVD files packed with cmsis-svd
+"""
+
+import os
+import json
+import cmsis_svd
+from svd import SVDReader
+from svd_cache import default_cache_dir
+
+
+def packed_version():
+    try:
+        from importlib.metadata import version
+        return version("cmsis-svd")
+    except Exception:
+        return "unknown"
+
+
+def data_mtime(data_path):
+    # the latest modification time of vendor directories and files in them,
+    # a file added, removed or replaced changes it
+    mtime = 0
+    try:
+        for vendor in os.scandir(data_path):
+            if vendor.is_dir():
+                mtime = max(mtime, vendor.stat().st_mtime_ns)
+                for entry in os.scandir(vendor.path):
+                    mtime = max(mtime, entry.stat().st_mtime_ns)
+    except OSError:
+        pass
+    return mtime
+
+
+class SVDCatalog:
+    def __init__(self, path=None):
+        self.path = path if path else default_cache_dir()
+        self.svd_reader = SVDReader()
+        self.__entries = None
+
+    def key(self):
+        # catalog is rebuilt when other cmsis-svd package version or location is used,
+        # or when packed files are changed in place (e.g. editable install)
+        data_path = os.path.join(cmsis_svd.__path__[0], "data")
+        return {"version": packed_version(),
+                "data_path": data_path,
+                "mtime": data_mtime(data_path)}
+
+    def entries(self):
+        if self.__entries is None:
+            self.__entries = self.load()
+        if self.__entries is None:
+            self.__entries = self.build()
+            self.store()
+        return self.__entries
+
+    def load(self):
+        try:
+            with open(self.__catalog_path(), "r") as f:
+                catalog = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if catalog.get("key") != self.key():
+            return None
+        return catalog["entries"]
+
+    def store(self):
+        try:
+            os.makedirs(self.path, exist_ok=True)
+            tmp_path = "%s.%d.tmp" % (self.__catalog_path(), os.getpid())
+            with open(tmp_path, "w") as f:
+                json.dump({"key": self.key(), "entries": self.__entries}, f)
+            os.replace(tmp_path, self.__catalog_path())
+            return True
+        except OSError:
+            return False
+
+    def build(self, summaries=None):
+        # summaries can be passed from outside to avoid scanning files twice
+        summaries = summaries if summaries else {}
+        entries = []
+        for vendor in self.svd_reader.get_packed_list():
+            for filename in vendor["filenames"]:
+                summary = summaries.get((vendor["vendor"], filename))
+                if summary is None:
+                    try:
+                        summary = self.svd_reader.get_summary(self.svd_reader.packed_path(vendor["vendor"], filename))
+                    except OSError:
+                        continue
+                entries += [dict(summary, vendor=vendor["vendor"], filename=filename)]
+        self.__entries = entries
+        return entries
+
+    def __catalog_path(self):
+        return os.path.join(self.path, "catalog.json")
+
+
+if __name__ == "__main__":
+    svd_catalog = SVDCatalog()
+    for entry in svd_catalog.entries():
+        print("%(vendor)-12s %(filename)-32s %(device)-24s %(cpu)-8s %(periphs)4d %(size)10d" % entry)
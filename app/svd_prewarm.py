@@ -0,0 +1,107 @@
+#!/user/bin/env python3
+
+"""
+Prewarm SVD cache and packed SVD catalog for openocd-svd
+
+Every SVD is parsed in a process pool, parsed device is put to the cache
+and time, peak memory and failures are reported per file.
+
+Run (paths are optional, packed cmsis-svd files are used by default):
+    python3 svd_prewarm.py [-j JOBS] [--cache-dir DIR] [path ...]
+"""
+
+# -- Imports ------------------------------------------------------------------
+import os
+import sys
+import time
+import argparse
+import tracemalloc
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from svd import SVDReader
+from svd_cache import SVDCache, default_cache_dir, DEFAULT_MAX_SIZE
+from svd_catalog import SVDCatalog
+
+
+# -- Workers ------------------------------------------------------------------
+def prewarm_file(path, cache_dir, max_size):
+    svd_reader = SVDReader(SVDCache(cache_dir, max_size), backend="iterparse")
+    result = {"path": path, "time": 0, "peak": 0, "error": None, "summary": None}
+    tracemalloc.start()
+    start = time.perf_counter()
+    try:
+        svd_reader.parse_path(path)
+        result["summary"] = svd_reader.get_summary(path)
+    except Exception as e:
+        result["error"] = "%s: %s" % (type(e).__name__, e)
+    result["time"] = time.perf_counter() - start
+    result["peak"] = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return result
+
+
+def find_svd(paths):
+    found = []
+    for path in paths:
+        if os.path.isdir(path):
+            for root, dirs, filenames in os.walk(path):
+                found += [os.path.join(root, n) for n in sorted(filenames) if n.lower().endswith((".svd", ".xml"))]
+        else:
+            found += [path]
+    return found
+
+
+# -- Standalone run -----------------------------------------------------------
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Parse SVD files to prewarm openocd-svd cache")
+    parser.add_argument("paths", nargs="*",
+                        help="SVD files or directories to scan (packed cmsis-svd files by default)")
+    parser.add_argument("-j", "--jobs", type=int, default=os.cpu_count(),
+                        help="number of worker processes")
+    parser.add_argument("--cache-dir", default=default_cache_dir(),
+                        help="cache directory (default: %(default)s)")
+    parser.add_argument("--max-size", type=int, default=DEFAULT_MAX_SIZE // 1024 // 1024,
+                        help="cache size limit, MiB (default: %(default)s, the same as openocd-svd uses)")
+    args = parser.parse_args()
+
+    svd_reader = SVDReader()
+    packed = {}
+    if args.paths:
+        paths = find_svd(args.paths)
+    else:
+        for vendor in svd_reader.get_packed_list():
+            for filename in vendor["filenames"]:
+                packed[svd_reader.packed_path(vendor["vendor"], filename)] = (vendor["vendor"], filename)
+        paths = list(packed.keys())
+
+    max_size = args.max_size * 1024 * 1024
+    results = []
+    start = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=args.jobs) as executor:
+        jobs = [executor.submit(prewarm_file, path, args.cache_dir, max_size) for path in paths]
+        for job in as_completed(jobs):
+            result = job.result()
+            results += [result]
+            print("%-4s %9.1f ms %9.1f MiB  %s%s" % ("FAIL" if result["error"] else "OK",
+                                                   result["time"] * 1000,
+                                                   result["peak"] / 1024 / 1024,
+                                                   result["path"],
+                                                   "  (%s)" % result["error"] if result["error"] else ""))
+            sys.stdout.flush()
+    elapsed = time.perf_counter() - start
+
+    svd_cache = SVDCache(args.cache_dir, max_size)
+    svd_cache.evict()
+    if packed:
+        svd_catalog = SVDCatalog(args.cache_dir)
+        svd_catalog.build({packed[result["path"]]: result["summary"] for result in results if result["summary"]})
+        svd_catalog.store()
+
+    failed = [result for result in results if result["error"]]
+    slowest = max(results, key=lambda result: result["time"]) if results else None
+    print("Parsed %d files in %.1f s with %d jobs, %d failed" % (len(results), elapsed, args.jobs, len(failed)))
+    if slowest:
+        print("Slowest: %s (%.1f ms)" % (slowest["path"], slowest["time"] * 1000))
+    print("Cache: %s, %d entries, %.1f MiB" % (svd_cache.path,
+                                              len(svd_cache.entries()),
+                                              svd_cache.size() / 1024 / 1024))
+    sys.exit(1 if failed else 0)
@@ -11,12 +11,18 @@ from PyQt5 import QtCore, QtGui, QtWidgets
 class Ui_SVDDialog(object):
     def setupUi(self, SVDDialog):
         SVDDialog.setObjectName("SVDDialog")
-        SVDDialog.resize(400, 500)
+        SVDDialog.resize(600, 500)
         self.verticalLayout = QtWidgets.QVBoxLayout(SVDDialog)
         self.verticalLayout.setObjectName("verticalLayout")
-        self.tree_svd = QtWidgets.QTreeWidget(SVDDialog)
+        self.edit_filter = QtWidgets.QLineEdit(SVDDialog)
+        self.edit_filter.setClearButtonEnabled(True)
+        self.edit_filter.setObjectName("edit_filter")
+        self.verticalLayout.addWidget(self.edit_filter)
+        self.tree_svd = QtWidgets.QTreeView(SVDDialog)
+        self.tree_svd.setEditTriggers(QtWidgets.QAbstractItemView.NoEditTriggers)
+        self.tree_svd.setUniformRowHeights(True)
+        self.tree_svd.setSortingEnabled(True)
         self.tree_svd.setObjectName("tree_svd")
-        self.tree_svd.headerItem().setText(0, "1")
         self.verticalLayout.addWidget(self.tree_svd)
         self.btn_dialog = QtWidgets.QDialogButtonBox(SVDDialog)
         self.btn_dialog.setOrientation(QtCore.Qt.Horizontal)
@@ -32,6 +38,7 @@ class Ui_SVDDialog(object):
     def retranslateUi(self, SVDDialog):
         _translate = QtCore.QCoreApplication.translate
         SVDDialog.setWindowTitle(_translate("SVDDialog", "Select SVD"))
+        self.edit_filter.setPlaceholderText(_translate("SVDDialog", "Type to filter by vendor, device, file or CPU"))
 
 
 if __name__ == "__main__":
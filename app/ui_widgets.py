@@ -5,10 +5,23 @@ Custom widgets special for openocd-svd
 """
 
 from PyQt5 import QtCore
-from PyQt5.QtGui import QCursor, QRegExpValidator, QIntValidator, QColor
-from PyQt5.QtWidgets import (QWidget, QComboBox, QCheckBox, QVBoxLayout,
-                             QHBoxLayout, QLabel, QTreeWidget, QTreeWidgetItem,
-                             QLineEdit, QAction, QPushButton, QSizePolicy)
+from PyQt5.QtGui import QCursor, QRegExpValidator, QIntValidator, QColor, QFont
+from PyQt5.QtWidgets import (QWidget, QComboBox, QVBoxLayout, QHBoxLayout, QLabel,
+                             QTreeView, QLineEdit, QAction, QMenu, QPushButton, QStyle,
+                             QStyledItemDelegate, QStyleOptionButton, QStyleOptionViewItem, QApplication,
+                             QAbstractItemView)
+
+
+# mask of the whole 32-bit register
+FULL_MASK = 0xffffffff
+# columns of register tree
+REG_COL = 0
+VAL_COL = 1
+# width of R and W buttons of register row
+BTN_WIDTH = 25
+# background of register rows and of values changed by the last read
+REG_COLOR = QColor(240, 240, 240)
+CHANGED_COLOR = QColor(255, 225, 150)
 
 
 class NumEdit(QLineEdit):
@@ -102,80 +115,220 @@ class NumEdit(QLineEdit):
 
     def setDisplayFormat(self, base, num=None):
         if num is not None:
-            self.setText(self.__format_num(num, base))
+            self.setText(format_num(num, base, self.numBitWidth()))
         else:
-            self.setText(self.__format_num(self.num(), base))
+            self.setText(format_num(self.num(), base, self.numBitWidth()))
         self.setDisplayValidator(base)
         self.__display_base = base
 
-    def __format_num(self, num, base):
-        if base == 10:
-            return str(num)
-        elif base == 16:
-            return format(num, '#0%dx' % (2 + int(self.numBitWidth() / 4) + (self.numBitWidth() % 4 > 0)))
-        elif base == 2:
-            chunk_n = 4
-            bin_str = format(num, '0%db' % self.numBitWidth())
-            return ' '.join(([bin_str[::-1][i:i + chunk_n] for i in range(0, len(bin_str), chunk_n)]))[::-1]
-        else:
-            raise ValueError("Can't __format_num() - unknown base")
-
 
-class RegEdit(QWidget):
-    def __init__(self, svd_reg):
-        QWidget.__init__(self)
-        self.svd = svd_reg
-        self.horiz_layout = QHBoxLayout(self)
-        self.horiz_layout.setContentsMargins(0, 0, 0, 0)
-        self.horiz_layout.setSpacing(0)
-        self.nedit_val = NumEdit(32)
-        self.nedit_val.editingFinished.connect(self.handle_reg_value_changed)
-        self.nedit_val.setMinimumSize(QtCore.QSize(320, 20))
-        self.nedit_val.setMaximumSize(QtCore.QSize(16777215, 20))
-        self.nedit_val.setSizePolicy(QSizePolicy(QSizePolicy.MinimumExpanding, QSizePolicy.Fixed))
-        self.horiz_layout.addWidget(self.nedit_val)
-        self.btn_read = QPushButton(self)
-        self.btn_read.setText("R")
-        self.btn_read.setMaximumSize(QtCore.QSize(25, 20))
-        self.horiz_layout.addWidget(self.btn_read)
-        self.btn_write = QPushButton(self)
-        self.btn_write.setText("W")
-        self.btn_write.setMaximumSize(QtCore.QSize(25, 20))
-        self.horiz_layout.addWidget(self.btn_write)
-        self.fields = {}
-        for field in self.svd["fields"]:
-            self.fields[field["name"]] = FieldEdit(field)
-            self.fields[field["name"]].valueChanged.connect(self.handle_field_value_changed)
+def format_num(num, base, num_bwidth):
+    if base == 10:
+        return str(num)
+    elif base == 16:
+        return format(num, '#0%dx' % (2 + int(num_bwidth / 4) + (num_bwidth % 4 > 0)))
+    elif base == 2:
+        chunk_n = 4
+        bin_str = format(num, '0%db' % num_bwidth)
+        return ' '.join(([bin_str[::-1][i:i + chunk_n] for i in range(0, len(bin_str), chunk_n)]))[::-1]
+    else:
+        raise ValueError("Can't format_num() - unknown base")
+
+
+class RegModel(QtCore.QAbstractItemModel):
+    """Registers of a peripheral as top level rows and their fields as children.
+
+    Register value is the only value kept, field values are cut from it on
+    display. Internal id of an index is 0 for a register and register row + 1
+    for a field. Bits changed by the last value from the target are kept to
+    highlight them. Pinned registers make the watch set read on every halt.
+    """
+    readRequested = QtCore.pyqtSignal(int)
+    writeRequested = QtCore.pyqtSignal(int)
+    # value is edited with auto-write on, unlike writeRequested it may be delayed
+    autoWriteRequested = QtCore.pyqtSignal(int)
+
+    def __init__(self, svd_regs, parent=None):
+        QtCore.QAbstractItemModel.__init__(self, parent)
+        self.regs = svd_regs
+        self.values = [0] * len(svd_regs)
+        self.edited_masks = [0] * len(svd_regs)
+        self.changed_masks = [0] * len(svd_regs)
+        self.pinned = set()
+        self.bases = {}
+        # built on first use: field masks per register row, enum value -> position
+        # per (register row, field row)
+        self.field_masks = {}
+        self.enum_positions = {}
         self.__opt_autowrite = False
 
-    # -- Slots --
-    def handle_reg_value_changed(self):
-        # if value changed we should set new fields values
-        for key in self.fields.keys():
-            val = self.val()
-            val = (val >> self.fields[key].svd["lsb"]) & ((2 ** self.fields[key].num_bwidth) - 1)
-            self.fields[key].setVal(val)
-        if self.autoWrite():
-            self.btn_write.clicked.emit()
-
-    def handle_field_value_changed(self):
-        # if field value changed we should set update reg value
-        val = self.val() & ~(((2 ** self.sender().num_bwidth) - 1) << self.sender().svd["lsb"])
-        val = val | (self.sender().val() << self.sender().svd["lsb"])
-        self.__update_val(val)
+    # -- Model --
+    def index(self, row, column, parent=QtCore.QModelIndex()):
+        if not self.hasIndex(row, column, parent):
+            return QtCore.QModelIndex()
+        if parent.isValid():
+            return self.createIndex(row, column, parent.row() + 1)
+        return self.createIndex(row, column, 0)
+
+    def parent(self, index):
+        if not index.isValid() or index.internalId() == 0:
+            return QtCore.QModelIndex()
+        return self.createIndex(index.internalId() - 1, 0, 0)
+
+    def rowCount(self, parent=QtCore.QModelIndex()):
+        if not parent.isValid():
+            return len(self.regs)
+        if parent.internalId() == 0 and parent.column() == REG_COL:
+            return len(self.regs[parent.row()]["fields"])
+        return 0
+
+    def columnCount(self, parent=QtCore.QModelIndex()):
+        return 2
+
+    def headerData(self, section, orientation, role=QtCore.Qt.DisplayRole):
+        if orientation == QtCore.Qt.Horizontal and role == QtCore.Qt.DisplayRole:
+            return ("Register", "Value")[section]
+        return None
+
+    def flags(self, index):
+        flags = QtCore.Qt.ItemIsEnabled | QtCore.Qt.ItemIsSelectable
+        if index.column() != VAL_COL:
+            return flags
+        field = self.field(index)
+        if field is None:
+            return flags | QtCore.Qt.ItemIsEditable
+        if field["access"] == "read-only":
+            return flags
+        if field["msb"] == field["lsb"]:
+            flags |= QtCore.Qt.ItemIsUserCheckable
+        if field["msb"] != field["lsb"] or field["enums"]:
+            flags |= QtCore.Qt.ItemIsEditable
+        return flags
+
+    def data(self, index, role=QtCore.Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        field = self.field(index)
+        if role == QtCore.Qt.DisplayRole:
+            if index.column() == REG_COL:
+                return self.svdItem(index)["name"]
+            if field is None:
+                return format_num(self.val(index.row()), self.base(index), 32)
+            if field["msb"] == field["lsb"] and not field["enums"]:
+                return None
+            val = self.fieldVal(index)
+            text = format_num(val, self.base(index), field["msb"] - field["lsb"] + 1)
+            enum = self.enum(index, val)
+            return "%s  %s : %s" % (text, enum["name"], enum["description"]) if enum else text
+        elif role == QtCore.Qt.EditRole and index.column() == VAL_COL:
+            return self.fieldVal(index) if field else self.val(index.row())
+        elif role == QtCore.Qt.CheckStateRole and index.column() == VAL_COL:
+            if field and field["msb"] == field["lsb"]:
+                return QtCore.Qt.Checked if self.fieldVal(index) else QtCore.Qt.Unchecked
+        elif role == QtCore.Qt.BackgroundRole:
+            if index.column() == VAL_COL and self.changed_masks[self.regRow(index)] & self.__mask(index):
+                return CHANGED_COLOR
+            if field is None:
+                return REG_COLOR
+        elif role == QtCore.Qt.ForegroundRole and field and field["access"] == "read-only":
+            return QColor(QtCore.Qt.gray)
+        elif role == QtCore.Qt.FontRole and field is None and index.row() in self.pinned:
+            font = QFont()
+            font.setBold(True)
+            return font
+        return None
+
+    def setData(self, index, value, role=QtCore.Qt.EditRole):
+        if index.column() != VAL_COL:
+            return False
+        row = self.regRow(index)
+        field = self.field(index)
+        if role == QtCore.Qt.CheckStateRole:
+            value = 1 if value == QtCore.Qt.Checked else 0
+        elif role != QtCore.Qt.EditRole:
+            return False
+        if field is None:
+            self.values[row] = value
+            self.edited_masks[row] = FULL_MASK
+        else:
+            mask = self.__mask(index)
+            self.values[row] = (self.values[row] & ~mask) | ((value << field["lsb"]) & mask)
+            self.edited_masks[row] |= mask
+        self.__emit_changed(row)
         if self.autoWrite():
-            self.btn_write.clicked.emit()
+            self.autoWriteRequested.emit(row)
+        return True
 
     # -- API --
-    def val(self):
-        return self.nedit_val.num()
-
-    def __update_val(self, val):
-        self.nedit_val.setNum(val)
+    def field(self, index):
+        if index.internalId() == 0:
+            return None
+        return self.regs[index.internalId() - 1]["fields"][index.row()]
+
+    def svdItem(self, index):
+        field = self.field(index)
+        return field if field else self.regs[index.row()]
+
+    def regRow(self, index):
+        return index.row() if index.internalId() == 0 else index.internalId() - 1
+
+    def regIndex(self, row, column=REG_COL):
+        return self.index(row, column)
+
+    def enumPosition(self, index, val):
+        """Position of field value in its enums or None"""
+        key = (self.regRow(index), index.row())
+        if key not in self.enum_positions:
+            self.enum_positions[key] = {int(enum["value"]): pos
+                                        for pos, enum in enumerate(self.field(index)["enums"] or [])}
+        return self.enum_positions[key].get(val)
+
+    def enum(self, index, val):
+        pos = self.enumPosition(index, val)
+        return None if pos is None else self.field(index)["enums"][pos]
+
+    def base(self, index):
+        return self.bases.get(self.__base_key(index), 16)
+
+    def setBase(self, index, base):
+        if self.base(index) != base:
+            self.bases[self.__base_key(index)] = base
+            index = index.siblingAtColumn(VAL_COL)
+            self.dataChanged.emit(index, index)
+
+    def val(self, row):
+        return self.values[row]
+
+    def fieldVal(self, index):
+        field = self.field(index)
+        return (self.values[self.regRow(index)] >> field["lsb"]) & ((2 ** (field["msb"] - field["lsb"] + 1)) - 1)
+
+    def setVal(self, row, val):
+        # value from the target replaces edits and is not written back; only cells
+        # with changed bits or a highlight to drop are repainted
+        changed = self.values[row] ^ val
+        dirty = changed | self.changed_masks[row]
+        self.values[row] = val
+        self.edited_masks[row] = 0
+        self.changed_masks[row] = changed
+        if dirty:
+            self.__emit_changed(row, dirty)
+
+    def isPinned(self, row):
+        return row in self.pinned
+
+    def setPinned(self, row, state):
+        if state:
+            self.pinned.add(row)
+        else:
+            self.pinned.discard(row)
+        self.dataChanged.emit(self.regIndex(row), self.regIndex(row, VAL_COL))
 
-    def setVal(self, val):
-        self.__update_val(val)
-        self.handle_reg_value_changed()
+    def takeEditedMask(self, row):
+        """Bits edited since the last call, the whole register if no field was
+        edited alone"""
+        mask, self.edited_masks[row] = self.edited_masks[row], 0
+        return mask if mask else FULL_MASK
 
     def autoWrite(self):
         return self.__opt_autowrite
@@ -183,88 +336,111 @@ class RegEdit(QWidget):
     def setAutoWrite(self, state):
         self.__opt_autowrite = state
 
+    def __base_key(self, index):
+        return (self.regRow(index), index.row() if index.internalId() else -1)
+
+    def __mask(self, index):
+        if index.internalId() == 0:
+            return FULL_MASK
+        return self.__field_masks(index.internalId() - 1)[index.row()]
+
+    def __field_masks(self, row):
+        if row not in self.field_masks:
+            self.field_masks[row] = [((2 ** (field["msb"] - field["lsb"] + 1)) - 1) << field["lsb"]
+                                     for field in self.regs[row]["fields"]]
+        return self.field_masks[row]
+
+    def __emit_changed(self, row, bits=FULL_MASK):
+        # one signal per run of adjacent fields overlapping the bits
+        reg_index = self.regIndex(row, VAL_COL)
+        self.dataChanged.emit(reg_index, reg_index)
+        parent = self.regIndex(row)
+        first = None
+        masks = self.__field_masks(row)
+        for num, mask in enumerate(masks + [0]):
+            if mask & bits and first is None:
+                first = num
+            elif not mask & bits and first is not None:
+                self.dataChanged.emit(self.index(first, VAL_COL, parent), self.index(num - 1, VAL_COL, parent))
+                first = None
+
+
+class RegDelegate(QStyledItemDelegate):
+    """Value column: editor is created only for the edited cell, R and W
+    buttons of register rows are painted and clicked without widgets"""
 
-class FieldEdit(QWidget):
-    valueChanged = QtCore.pyqtSignal()
-
-    def __init__(self, svd_field):
-        QWidget.__init__(self)
-        self.svd = svd_field
-        self.horiz_layout = QHBoxLayout(self)
-        self.horiz_layout.setContentsMargins(0, 0, 0, 0)
-        self.horiz_layout.setSpacing(6)
-        if self.svd["access"] == "read-only":
-            self.is_enabled = False
+    # -- Events --
+    def paint(self, painter, option, index):
+        if index.internalId() != 0:
+            QStyledItemDelegate.paint(self, painter, option, index)
+            return
+        option = QStyleOptionViewItem(option)
+        text_rect, buttons = self.__split(option.rect)
+        option.rect = text_rect
+        QStyledItemDelegate.paint(self, painter, option, index)
+        for text, rect in zip(("R", "W"), buttons):
+            button = QStyleOptionButton()
+            button.rect = rect
+            button.text = text
+            button.state = QStyle.State_Enabled | QStyle.State_Raised
+            QApplication.style().drawControl(QStyle.CE_PushButton, button, painter)
+
+    def editorEvent(self, event, model, option, index):
+        if index.internalId() == 0 and event.type() in (QtCore.QEvent.MouseButtonPress,
+                                                        QtCore.QEvent.MouseButtonRelease,
+                                                        QtCore.QEvent.MouseButtonDblClick):
+            text_rect, buttons = self.__split(option.rect)
+            for signal, rect in zip((model.readRequested, model.writeRequested), buttons):
+                if rect.contains(event.pos()):
+                    if event.type() == QtCore.QEvent.MouseButtonRelease:
+                        signal.emit(index.row())
+                    return True
+        return QStyledItemDelegate.editorEvent(self, event, model, option, index)
+
+    # -- Editors --
+    def createEditor(self, parent, option, index):
+        model = index.model()
+        field = model.field(index)
+        if field and field["enums"]:
+            editor = QComboBox(parent)
+            for enum in field["enums"]:
+                editor.addItem("(0x%x) %s : %s" % (int(enum["value"]), enum["name"], enum["description"]),
+                               int(enum["value"]))
+            editor.activated.connect(lambda: self.commitData.emit(editor))
+            return editor
+        editor = NumEdit(field["msb"] - field["lsb"] + 1 if field else 32)
+        editor.setParent(parent)
+        # every change (wheel too) is committed at once, as widgets did before
+        editor.editingFinished.connect(lambda: self.commitData.emit(editor))
+        return editor
+
+    def setEditorData(self, editor, index):
+        val = index.data(QtCore.Qt.EditRole)
+        if isinstance(editor, QComboBox):
+            pos = index.model().enumPosition(index, val)
+            editor.setCurrentIndex(-1 if pos is None else pos)
         else:
-            self.is_enabled = True
+            editor.setNum(val, index.model().base(index))
 
-        self.num_bwidth = self.svd["msb"] - self.svd["lsb"] + 1
-
-        if self.num_bwidth == 1:
-            self.chbox_val = QCheckBox(self)
-            self.chbox_val.setEnabled(self.is_enabled)
-            self.chbox_val.setMaximumSize(QtCore.QSize(16777215, 20))
-            self.chbox_val.stateChanged.connect(self.handle_field_value_changed)
-            self.horiz_layout.addWidget(self.chbox_val)
-        else:
-            self.nedit_val = NumEdit(self.num_bwidth)
-            self.nedit_val.setEnabled(self.is_enabled)
-            self.nedit_val.editingFinished.connect(self.handle_field_value_changed)
-            self.nedit_val.setMaximumSize(QtCore.QSize(16777215, 20))
-            self.horiz_layout.addWidget(self.nedit_val)
-
-        if self.svd["enums"]:
-            self.is_enums = True
-            self.combo_enum = QComboBox(self)
-            self.combo_enum.setEnabled(self.is_enabled)
-            self.combo_enum.currentIndexChanged.connect(self.handle_enum_value_changed)
-            self.combo_enum.values = []
-            for enum in self.svd["enums"]:
-                self.combo_enum.values += [int(enum["value"])]
-                self.combo_enum.addItem("(0x%x) %s : %s" % (int(enum["value"]), enum["name"], enum["description"]))
-            self.combo_enum.setMaximumSize(QtCore.QSize(16777215, 20))
-            self.horiz_layout.addWidget(self.combo_enum)
-            if self.num_bwidth == 1:
-                self.chbox_val.setMaximumSize(QtCore.QSize(320, 20))
-            else:
-                self.nedit_val.setMaximumSize(QtCore.QSize(320, 20))
+    def setModelData(self, editor, model, index):
+        if isinstance(editor, QComboBox):
+            if editor.currentIndex() != -1:
+                model.setData(index, editor.currentData())
         else:
-            self.is_enums = False
+            # base change refreshes the open editor, so its value is taken first
+            base, num = editor.displayBase(), editor.num() if editor.hasAcceptableInput() else None
+            if num is not None and num != index.data(QtCore.Qt.EditRole):
+                model.setData(index, num)
+            model.setBase(index, base)
 
-    # -- Slots --
-    def handle_field_value_changed(self, value=None):
-        if self.is_enums:
-            try:
-                if self.val() != self.combo_enum.values[self.combo_enum.currentIndex()]:
-                    self.combo_enum.setCurrentIndex(self.combo_enum.values.index(self.val()))
-            except ValueError:
-                self.combo_enum.setCurrentIndex(-1)
-        self.valueChanged.emit()
-
-    def handle_enum_value_changed(self, currentIndex):
-        if self.is_enums and currentIndex != -1:
-            if self.val() != self.combo_enum.values[currentIndex]:
-                self.setVal(self.combo_enum.values[currentIndex])
+    def updateEditorGeometry(self, editor, option, index):
+        editor.setGeometry(self.__split(option.rect)[0] if index.internalId() == 0 else option.rect)
 
-    # -- API --
-    def val(self):
-        if self.num_bwidth == 1:
-            if self.chbox_val.checkState():
-                return 1
-            else:
-                return 0
-        else:
-            return self.nedit_val.num()
-
-    def setVal(self, val):
-        if self.num_bwidth == 1:
-            if val:
-                self.chbox_val.setCheckState(QtCore.Qt.Checked)
-            else:
-                self.chbox_val.setCheckState(QtCore.Qt.Unchecked)
-        else:
-            self.nedit_val.setNum(val)
-        self.handle_field_value_changed()
+    def __split(self, rect):
+        # value part and R, W buttons at the right side of the cell
+        text_rect = rect.adjusted(0, 0, -2 * BTN_WIDTH, 0)
+        return text_rect, [QtCore.QRect(text_rect.right() + 1 + num * BTN_WIDTH, rect.top(), BTN_WIDTH, rect.height())
+                           for num in range(2)]
 
 
 class PeriphTab(QWidget):
@@ -284,36 +460,28 @@ class PeriphTab(QWidget):
         self.lab_periph_descr.setTextInteractionFlags(QtCore.Qt.LinksAccessibleByMouse |
                                                       QtCore.Qt.TextSelectableByMouse)
         self.horiz_layout.addWidget(self.lab_periph_descr)
+        self.combo_target = QComboBox(self.header)
+        self.combo_target.setToolTip("OpenOCD target of the peripheral")
+        self.combo_target.setSizeAdjustPolicy(QComboBox.AdjustToContents)
+        self.combo_target.setMaximumSize(QtCore.QSize(16777215, 20))
+        self.horiz_layout.addWidget(self.combo_target)
         self.btn_readall = QPushButton(self.header)
         self.btn_readall.setText("Read all")
         self.btn_readall.setMaximumSize(QtCore.QSize(100, 20))
-        self.btn_readall.clicked.connect(self.handle_btn_readall_clicked)
         self.horiz_layout.addWidget(self.btn_readall)
         self.vert_layout.addWidget(self.header)
-        # tree widget for displaying regs
-        reg_col = 0
-        val_col = 1
-        self.tree_regs = QTreeWidget(self)
-        self.tree_regs.itemSelectionChanged.connect(self.handle_tree_selection_changed)
-        self.tree_regs.headerItem().setText(reg_col, "Register")
-        self.tree_regs.setColumnWidth(reg_col, 200)
-        self.tree_regs.headerItem().setText(val_col, "Value")
-        for reg in self.svd["regs"]:
-            item0 = QTreeWidgetItem(self.tree_regs)
-            item0.svd = reg
-            item0.setText(reg_col, reg["name"])
-            background = QColor(240, 240, 240)
-            item0.setBackground(0, background)
-            item0.setBackground(1, background)
-            reg_edit = RegEdit(reg)
-            self.tree_regs.setItemWidget(item0, val_col, reg_edit)
-            self.tree_regs.addTopLevelItem(item0)
-            for field in reg["fields"]:
-                item1 = QTreeWidgetItem(item0)
-                item1.svd = field
-                item1.setText(reg_col, field["name"])
-                self.tree_regs.setItemWidget(item1, val_col, reg_edit.fields[field["name"]])
-                item0.addChild(item1)
+        # tree view for displaying regs, editors are created only for the edited cell
+        self.model = RegModel(self.svd.flat_regs(), self)
+        self.tree_regs = QTreeView(self)
+        self.tree_regs.setModel(self.model)
+        self.tree_regs.setItemDelegateForColumn(VAL_COL, RegDelegate(self.tree_regs))
+        self.tree_regs.setUniformRowHeights(True)
+        self.tree_regs.setEditTriggers(QAbstractItemView.DoubleClicked | QAbstractItemView.SelectedClicked |
+                                       QAbstractItemView.EditKeyPressed | QAbstractItemView.AnyKeyPressed)
+        self.tree_regs.setColumnWidth(REG_COL, 200)
+        self.tree_regs.setContextMenuPolicy(QtCore.Qt.CustomContextMenu)
+        self.tree_regs.customContextMenuRequested.connect(self.handle_context_menu_requested)
+        self.tree_regs.selectionModel().currentChanged.connect(self.handle_tree_current_changed)
         self.vert_layout.addWidget(self.tree_regs)
         # label with register/field description
         self.lab_info = QLabel(self)
@@ -323,29 +491,84 @@ class PeriphTab(QWidget):
         self.lab_info.setTextInteractionFlags(QtCore.Qt.LinksAccessibleByMouse |
                                               QtCore.Qt.TextSelectableByMouse)
         self.vert_layout.addWidget(self.lab_info)
+        # values read while the tab was hidden, shown when it is shown
+        self.pending_vals = {}
+
+    # -- Events --
+    def showEvent(self, event):
+        pending, self.pending_vals = self.pending_vals, {}
+        for row, val in pending.items():
+            self.model.setVal(row, val)
+        QWidget.showEvent(self, event)
 
     # -- Slots --
-    def handle_tree_selection_changed(self):
-        tree_item = self.tree_regs.selectedItems()[0]
-        name = tree_item.svd["name"]
-        descr = tree_item.svd["description"]
-        addr = tree_item.svd["address_offset"]
-        if "access" in tree_item.svd.keys() and tree_item.svd["access"]:
-            temp = tree_item.svd["access"]
-            access = "<%s>" % (temp.split("-")[0][0] + temp.split("-")[1][0]).upper()
+    def handle_tree_current_changed(self, current, previous):
+        if not current.isValid():
+            return
+        svd_item = self.model.svdItem(current)
+        name = svd_item["name"]
+        descr = svd_item["description"]
+        addr = svd_item["address_offset"]
+        if "access" in svd_item.keys() and svd_item["access"]:
+            access = "<%s>" % "".join(part[0] for part in svd_item["access"].split("-")).upper()
         else:
             access = ""
-        if "msb" in tree_item.svd.keys():
-            bits = "[%d:%d]" % (tree_item.svd["msb"],
-                                tree_item.svd["lsb"])
+        if "msb" in svd_item.keys():
+            bits = "[%d:%d]" % (svd_item["msb"],
+                                svd_item["lsb"])
         else:
             bits = ""
         self.lab_info.setText("(0x%08x)%s%s : %s\n%s" % (addr, bits, access, name, descr))
 
-    def handle_btn_readall_clicked(self):
-        for reg_n in range(0, self.tree_regs.topLevelItemCount()):
-            reg = self.tree_regs.itemWidget(self.tree_regs.topLevelItem(reg_n), 1)
-            reg.btn_read.clicked.emit()
+    def handle_context_menu_requested(self, pos):
+        index = self.tree_regs.indexAt(pos)
+        if not index.isValid():
+            return
+        index = index.siblingAtColumn(VAL_COL)
+        self.menu = QMenu(self)
+        self.menu.act_to_dec = self.menu.addAction("Convert to Dec")
+        self.menu.act_to_dec.triggered.connect(lambda: self.model.setBase(index, 10))
+        self.menu.act_to_hex = self.menu.addAction("Convert to Hex")
+        self.menu.act_to_hex.triggered.connect(lambda: self.model.setBase(index, 16))
+        self.menu.act_to_bin = self.menu.addAction("Convert to Bin")
+        self.menu.act_to_bin.triggered.connect(lambda: self.model.setBase(index, 2))
+        self.menu.addSeparator()
+        row = self.model.regRow(index)
+        self.menu.act_pin = self.menu.addAction("Pin to watch set")
+        self.menu.act_pin.setToolTip("Read the register on every halt")
+        self.menu.act_pin.setCheckable(True)
+        self.menu.act_pin.setChecked(self.model.isPinned(row))
+        self.menu.act_pin.triggered.connect(lambda state: self.model.setPinned(row, state))
+        self.menu.exec_(QCursor.pos())
+
+    # -- API --
+    def target(self):
+        return self.combo_target.currentText() or None
+
+    def setTargets(self, targets):
+        # chosen target is kept while it is still connected
+        current = self.combo_target.currentText()
+        self.combo_target.clear()
+        self.combo_target.addItems(targets)
+        if current in targets:
+            self.combo_target.setCurrentIndex(targets.index(current))
+
+    def setVal(self, row, val, lazy=False):
+        # lazy value of a hidden tab waits until the tab is shown
+        if lazy and not self.isVisible():
+            self.pending_vals[row] = val
+        else:
+            self.pending_vals.pop(row, None)
+            self.model.setVal(row, val)
+
+    def select_reg(self, svd_reg):
+        for row, reg in enumerate(self.model.regs):
+            if reg == svd_reg:
+                index = self.model.regIndex(row)
+                self.tree_regs.setCurrentIndex(index)
+                self.tree_regs.scrollTo(index)
+                self.tree_regs.expand(index)
+                break
 
 
 # -- Standalone run -----------------------------------------------------------
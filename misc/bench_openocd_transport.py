@@ -0,0 +1,241 @@
+#!/user/bin/env python3
+
+"""
+Compare command latency of OpenOCD telnet and TCL RPC transports, blocking
+and asyncio clients
+
+Local stand-in server answers both protocols the way OpenOCD does (telnet
+echoes command and ends reply with a prompt, TCL RPC ends reply with 0x1a),
+optional delay emulates latency of remote link for every received packet, so
+pipelined commands pay it once. Real OpenOCD can be used instead.
+
+Run:
+    python3 bench_openocd_transport.py [-n COUNT] [-p PROBES] [--delay MS]
+    python3 bench_openocd_transport.py --host HOST  # real OpenOCD on ports 4444 and 6666
+"""
+
+import os
+import re
+import sys
+import time
+import socket
+import asyncio
+import argparse
+import threading
+import statistics
+import socketserver
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "app"))
+from openocd import OpenOCDTelnet, OpenOCDTclRpc  # noqa: E402
+from openocd_async import AsyncOpenOCDTelnet, AsyncOpenOCDTclRpc  # noqa: E402
+
+
+# -- Stand-in server ----------------------------------------------------------
+def execute(cmd, memory, context):
+    # context keeps current target of the connection and the server with all
+    # targets and their state
+    cmd = cmd.strip()
+    if cmd == "target current":
+        return context["target"]
+    elif cmd == "target names":
+        return " ".join(context["server"].targets)
+    elif cmd.startswith("targets "):
+        if cmd.split()[1] not in context["server"].targets:
+            return "Target %s not found" % cmd.split()[1]
+        context["target"] = cmd.split()[1]
+        return ""
+    elif cmd.endswith(" curstate"):
+        return context["server"].state
+    elif cmd.startswith("set _state ["):
+        server = context["server"]
+        return "%s %d" % (server.state, server.halts) + (" pc (/32): 0x%08x" % server.pc
+                                                         if server.state == "halted" else "")
+    elif cmd.startswith("set _event [") or cmd.startswith("proc "):
+        return ""
+    elif cmd.startswith("openocd_svd_rmw "):
+        addr, mask, val = (int(arg, 16) for arg in cmd.split()[1:4])
+        memory[addr] = (memory.get(addr, 0) & ~mask) | (val & mask)
+        return "0x%08x" % memory[addr]
+    elif cmd == "reg pc":
+        return "pc (/32): 0x%08x" % context["server"].pc
+    elif cmd.startswith("mdw "):
+        args = cmd.split()
+        addr = int(args[1], 16)
+        count = int(args[2]) if len(args) > 2 else 1
+        lines = []
+        for line_addr in range(addr, addr + count * 4, 32):
+            words = range(line_addr, min(line_addr + 32, addr + count * 4), 4)
+            lines += ["0x%08x: %s " % (line_addr, " ".join("%08x" % memory.get(word, 0) for word in words))]
+        return "\n".join(lines)
+    elif cmd.startswith("mww "):
+        addr, val = (int(arg, 16) for arg in cmd.split()[1:3])
+        memory[addr] = val
+        return ""
+    elif cmd:
+        return "invalid command name \"%s\"" % cmd.split()[0]
+    return ""
+
+
+class TelnetHandler(socketserver.BaseRequestHandler):
+    def handle(self):
+        self.request.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.request.sendall(b"Open On-Chip Debugger\r\n\r> ")
+        context = {"server": self.server, "target": self.server.targets[0]}
+        data = b""
+        while True:
+            chunk = self.request.recv(4096)
+            if not chunk:
+                break
+            data += chunk
+            time.sleep(self.server.delay)
+            replies = ""
+            while b"\n" in data:
+                line, data = data.split(b"\n", 1)
+                cmd = line.decode().strip()
+                result = execute(cmd, self.server.memory, context)
+                replies += cmd + "\r\n" + (result.replace("\n", "\r\n") + "\r\n" if result else "") + "\r> "
+            self.request.sendall(replies.encode())
+
+
+class TclRpcHandler(socketserver.BaseRequestHandler):
+    def handle(self):
+        self.request.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        context = {"server": self.server, "target": self.server.targets[0]}
+        data = b""
+        while True:
+            chunk = self.request.recv(4096)
+            if not chunk:
+                break
+            data += chunk
+            time.sleep(self.server.delay)
+            replies = b""
+            while b"\x1a" in data:
+                line, data = data.split(b"\x1a", 1)
+                cmd = re.sub(r"^capture \{(.*)\}$", r"\1", line.decode().strip())
+                replies += execute(cmd, self.server.memory, context).encode() + b"\x1a"
+            self.request.sendall(replies)
+
+
+def start_server(handler, delay, targets=("stm32f1x.cpu",)):
+    server = socketserver.ThreadingTCPServer(("localhost", 0), handler)
+    server.daemon_threads = True
+    server.delay = delay
+    server.memory = {}
+    server.targets = list(targets)
+    server.state = "halted"
+    server.pc = 0x08000144
+    server.halts = 0
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+# -- Benchmark ----------------------------------------------------------------
+def bench(transport, host, port, count, batch):
+    start = time.perf_counter()
+    transport.open(host, port)
+    opened = time.perf_counter() - start
+    transport.write_mem(0x20000000, 0x12345678)
+    transport.write_mem(0x20000044, 0x9abcdef0)
+    if (transport.read_mem(0x20000000) != 0x12345678 or
+            transport.read_mem_block(0x20000000, 20)[::17] != [0x12345678, 0x9abcdef0]):
+        raise RuntimeError("%s: read back mismatch" % transport.__class__.__name__)
+    times = []
+    for i in range(count):
+        start = time.perf_counter()
+        transport.read_mem(0x20000000 + 4 * (i % 16))
+        transport.get_target_state()
+        times += [(time.perf_counter() - start) / 2]
+    blocks = [(0x20000000 + 64 * i, 16) for i in range(batch)]
+    start = time.perf_counter()
+    for block in blocks:
+        transport.read_mem_block(*block)
+    sequential = time.perf_counter() - start
+    start = time.perf_counter()
+    outputs = transport.exec_cmds(["mdw 0x%08x %d" % block for block in blocks])
+    pipelined = time.perf_counter() - start
+    if outputs != transport.exec_cmds(["mdw 0x%08x %d" % block for block in blocks]):
+        raise RuntimeError("%s: pipelined replies mismatch" % transport.__class__.__name__)
+    transport.close()
+    return opened, times, sequential, pipelined
+
+
+async def bench_async(transport, host, port, count, batch):
+    start = time.perf_counter()
+    await transport.open(host, port)
+    opened = time.perf_counter() - start
+    await transport.write_mem(0x20000000, 0x12345678)
+    if await transport.read_mem(0x20000000) != 0x12345678:
+        raise RuntimeError("%s: read back mismatch" % transport.__class__.__name__)
+    times = []
+    for i in range(count):
+        start = time.perf_counter()
+        await transport.read_mem(0x20000000 + 4 * (i % 16))
+        await transport.get_target_state()
+        times += [(time.perf_counter() - start) / 2]
+    blocks = [(0x20000000 + 64 * i, 16) for i in range(batch)]
+    start = time.perf_counter()
+    for block in blocks:
+        await transport.read_mem_block(*block)
+    sequential = time.perf_counter() - start
+    start = time.perf_counter()
+    await transport.read_mem_blocks(blocks)
+    pipelined = time.perf_counter() - start
+    await transport.close()
+    return opened, times, sequential, pipelined
+
+
+async def bench_probes(transport_class, host, port, probes, batch):
+    # several connections on one event loop, as with several probes in one process
+    transports = [transport_class() for i in range(probes)]
+    await asyncio.gather(*[transport.open(host, port) for transport in transports])
+    blocks = [(0x20000000 + 64 * i, 16) for i in range(batch)]
+    start = time.perf_counter()
+    for transport in transports:
+        await transport.read_mem_blocks(blocks)
+    sequential = time.perf_counter() - start
+    start = time.perf_counter()
+    await asyncio.gather(*[transport.read_mem_blocks(blocks) for transport in transports])
+    concurrent = time.perf_counter() - start
+    await asyncio.gather(*[transport.close() for transport in transports])
+    return sequential, concurrent
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare OpenOCD telnet and TCL RPC latency")
+    parser.add_argument("-n", "--count", type=int, default=200, help="number of command pairs")
+    parser.add_argument("-b", "--batch", type=int, default=16, help="number of block reads in a batch")
+    parser.add_argument("--delay", type=float, default=0, help="stand-in server delay per command, ms")
+    parser.add_argument("-p", "--probes", type=int, default=4, help="number of asyncio connections at once")
+    parser.add_argument("--host", help="real OpenOCD host instead of the stand-in server")
+    args = parser.parse_args()
+
+    if args.host:
+        host, ports = args.host, {"telnet": 4444, "tcl rpc": 6666}
+    else:
+        telnet_server = start_server(TelnetHandler, args.delay / 1000)
+        tcl_rpc_server = start_server(TclRpcHandler, args.delay / 1000)
+        host, ports = "localhost", {"telnet": telnet_server.server_address[1],
+                                    "tcl rpc": tcl_rpc_server.server_address[1]}
+
+    print("%-13s %10s %10s %10s %10s %12s %12s" % ("", "open, ms", "mean, ms", "median", "p95",
+                                                   "batch, ms", "pipelined"))
+    for name, transport in (("telnet", OpenOCDTelnet()), ("tcl rpc", OpenOCDTclRpc()),
+                            ("async telnet", AsyncOpenOCDTelnet()), ("async tcl rpc", AsyncOpenOCDTclRpc())):
+        port = ports[name.replace("async ", "")]
+        if name.startswith("async"):
+            result = asyncio.run(bench_async(transport, host, port, args.count, args.batch))
+        else:
+            result = bench(transport, host, port, args.count, args.batch)
+        opened, times, sequential, pipelined = result
+        times = sorted(times)
+        print("%-13s %10.2f %10.3f %10.3f %10.3f %12.2f %12.2f" % (name, opened * 1000,
+                                                                 statistics.mean(times) * 1000,
+                                                                 statistics.median(times) * 1000,
+                                                                 times[int(len(times) * 0.95)] * 1000,
+                                                                 sequential * 1000, pipelined * 1000))
+
+    print("\n%-13s %14s %14s" % ("%d probes" % args.probes, "one by one, ms", "concurrent, ms"))
+    for name, transport_class in (("async telnet", AsyncOpenOCDTelnet), ("async tcl rpc", AsyncOpenOCDTclRpc)):
+        port = ports[name.replace("async ", "")]
+        sequential, concurrent = asyncio.run(bench_probes(transport_class, host, port, args.probes, args.batch))
+        print("%-13s %14.2f %14.2f" % (name, sequential * 1000, concurrent * 1000))
@@ -0,0 +1,65 @@
+#!/user/bin/env python3
+
+"""
+Compare memory taken by slotted device model and by plain dict model
+on the largest packed cmsis-svd files
+
+Run (number of files is optional, 5 by default):
+    python3 bench_svd_model.py [files_number]
+"""
+
+import os
+import sys
+import gc
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "app"))
+import cmsis_svd  # noqa: E402
+from svd import SVDReader  # noqa: E402
+
+
+def largest_packed(number):
+    data_path = os.path.join(cmsis_svd.__path__[0], "data")
+    packed = []
+    for vendor in SVDReader().get_packed_list():
+        for filename in vendor["filenames"]:
+            packed += [(os.path.getsize(os.path.join(data_path, vendor["vendor"], filename)),
+                        vendor["vendor"], filename)]
+    return sorted(packed, reverse=True)[:number]
+
+
+def to_dicts(item, memo):
+    # old dict model, keeping the sharing of derived registers it had
+    if id(item) not in memo:
+        memo[id(item)] = {key: [to_dicts(i, memo) for i in value] if isinstance(value, tuple) else value
+                          for key, value in item.items()}
+    return memo[id(item)]
+
+
+def build_dicts(device):
+    memo = {}
+    return [to_dicts(periph, memo) for periph in device]
+
+
+def measure(build):
+    gc.collect()
+    tracemalloc.start()
+    model = build()
+    gc.collect()
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return model, size
+
+
+if __name__ == "__main__":
+    number = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+    print("%-32s %10s %12s %12s %6s" % ("SVD", "fields", "dict, KiB", "slots, KiB", "ratio"))
+    for size, vendor, filename in largest_packed(number):
+        svd_reader = SVDReader(backend="iterparse")
+        svd_reader.parse_packed(vendor, filename)
+        fields = sum(len(reg.fields) for periph in svd_reader.device for reg in periph.regs)
+        # reparse to measure slotted model alone, then convert it to the old nested dicts
+        slots, slots_size = measure(lambda: (svd_reader.parse_packed(vendor, filename), svd_reader.device)[1])
+        dicts, dicts_size = measure(lambda: build_dicts(slots))
+        print("%-32s %10d %12d %12d %6.2f" % ("%s/%s" % (vendor, filename), fields,
+                                              dicts_size / 1024, slots_size / 1024, dicts_size / slots_size))
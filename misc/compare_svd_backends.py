@@ -0,0 +1,80 @@
+#!/user/bin/env python3
+
+"""
+Compare output of SVDReader backends and lazy mode over packed cmsis-svd data set
+
+Run (vendor filter is optional):
+    python3 compare_svd_backends.py [vendor ...]
+"""
+
+import os
+import sys
+from multiprocessing import Pool
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "app"))
+from svd import SVDReader  # noqa: E402
+
+
+def parse(backend, vendor, filename, lazy=False):
+    svd_reader = SVDReader(backend=backend, lazy=lazy)
+    try:
+        svd_reader.parse_packed(vendor, filename)
+        for periph in svd_reader.device:
+            periph.regs
+    except Exception as e:
+        return "%s: %s" % (type(e).__name__, e)
+    return svd_reader.device
+
+
+def normalize(device, derived, reference=None):
+    # cmsis-svd does not see derivedFrom attribute of registers and fields,
+    # so registers derived in the file can only be compared by placement;
+    # it does not see clusters too, so only registers known to reference are taken
+    result = []
+    for num, periph in enumerate(device):
+        regs = []
+        names = {reg.name for reg in reference[num].flat_regs()} if reference else None
+        for reg in periph.flat_regs():
+            if names is not None and reg.name not in names:
+                continue
+            if (periph["name"], reg["name"]) in derived:
+                regs += [(reg["name"], reg["address_offset"])]
+            else:
+                regs += [(reg["name"], reg["address_offset"], reg["description"],
+                          [dict(field, derived_from=None) for field in reg["fields"]])]
+        result += [dict(periph, regs=regs)]
+    return result
+
+
+def compare(job):
+    vendor, filename = job
+    reference = parse("cmsis", vendor, filename)
+    streamed = parse("iterparse", vendor, filename)
+    if isinstance(reference, str):
+        return (vendor, filename, "skip" if isinstance(streamed, str) else "fail", reference)
+    if isinstance(streamed, str):
+        return (vendor, filename, "fail", streamed)
+    lazy = parse("iterparse", vendor, filename, lazy=True)
+    if lazy != streamed:
+        return (vendor, filename, "fail", "lazy device differs")
+    derived = {(periph.name, reg.name) for periph in streamed for reg in periph.flat_regs() if reg.derived_from}
+    if normalize(reference, derived) != normalize(streamed, derived, reference):
+        return (vendor, filename, "fail", "device differs")
+    return (vendor, filename, "ok", "")
+
+
+if __name__ == "__main__":
+    jobs = []
+    for vendor in SVDReader().get_packed_list():
+        if len(sys.argv) > 1 and vendor["vendor"] not in sys.argv[1:]:
+            continue
+        jobs += [(vendor["vendor"], filename) for filename in vendor["filenames"]]
+
+    results = {"ok": 0, "skip": 0, "fail": 0}
+    with Pool() as pool:
+        for vendor, filename, status, info in pool.imap_unordered(compare, jobs):
+            results[status] += 1
+            if status != "ok":
+                print("%s %s/%s %s" % (status.upper(), vendor, filename, info))
+    print("ok: %d, skipped (both backends failed): %d, failed: %d" % (results["ok"], results["skip"], results["fail"]))
+    sys.exit(1 if results["fail"] else 0)
@@ -0,0 +1,122 @@
+#!/user/bin/env python3
+
+"""
+Stress asyncio OpenOCD client with concurrent GUI-like and poller-like traffic
+
+Poller task asks target status, GUI tasks do block reads, all over one
+connection to the stand-in server from bench_openocd_transport.py, the way
+the GUI drives the pool. CPU time of the process is compared with wall time -
+tasks waiting for the connection must sleep, not spin. Timeout and
+cancellation of the wait are checked too, including ones which hit just as
+the connection gets free, after which the lock must not be left taken.
+
+Run:
+    python3 stress_openocd_lock.py [-t SECONDS] [--gui-tasks N] [--delay MS] [--max-cpu PERCENT]
+"""
+
+import os
+import sys
+import time
+import asyncio
+import argparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "app"))
+from openocd_async import AsyncOpenOCDTelnet, AsyncOpenOCDTclRpc  # noqa: E402
+from openocd_common import OpenOCDTimeout  # noqa: E402
+from bench_openocd_transport import start_server, TelnetHandler, TclRpcHandler  # noqa: E402
+
+
+async def poller(transport, stop, counts):
+    while not stop.is_set():
+        await transport.get_target_status()
+        counts["poller"] += 1
+
+
+async def gui(transport, stop, counts):
+    while not stop.is_set():
+        await transport.read_mem_blocks([(0x20000000, 16), (0x20000100, 4)])
+        counts["gui"] += 1
+
+
+async def check_wait(transport, server):
+    # connection is held by a slow command, other callers must time out or be cancelled
+    server.delay = 0.3
+    holder = asyncio.ensure_future(transport.get_target_state())
+    await asyncio.sleep(0.05)
+    errors = []
+    start = time.perf_counter()
+    try:
+        await transport.send_cmd("target current", timeout=0.05)
+        errors += ["no timeout"]
+    except OpenOCDTimeout:
+        if time.perf_counter() - start > 0.2:
+            errors += ["timeout too late"]
+    waiter = asyncio.ensure_future(transport.send_cmd("target current"))
+    await asyncio.sleep(0.05)
+    start = time.perf_counter()
+    waiter.cancel()
+    try:
+        await waiter
+        errors += ["no cancel"]
+    except asyncio.CancelledError:
+        if time.perf_counter() - start > 0.2:
+            errors += ["cancel too late"]
+    await holder
+    server.delay = 0
+    if await transport.send_cmd("target current") != "stm32f1x.cpu":
+        errors += ["connection broken after timeout or cancel"]
+    return errors
+
+
+async def check_race(transport, rounds=200):
+    # waits timed out or cancelled around the moment the lock is released
+    for num in range(rounds):
+        holder = asyncio.ensure_future(transport.send_cmd("target current"))
+        await asyncio.sleep(0)
+        waiter = asyncio.ensure_future(transport.send_cmd("target current", timeout=0.0002 * (num % 10)))
+        if num % 2:
+            await asyncio.sleep(0.0002 * (num % 7))
+            waiter.cancel()
+        await asyncio.gather(holder, waiter, return_exceptions=True)
+        if transport.lock.locked():
+            return ["lock left taken after round %d" % num]
+    return []
+
+
+async def stress(transport_class, handler, args):
+    server = start_server(handler, args.delay / 1000)
+    transport = transport_class()
+    await transport.open("localhost", server.server_address[1])
+    stop = asyncio.Event()
+    counts = {"poller": 0, "gui": 0}
+    wall, cpu = time.perf_counter(), time.process_time()
+    tasks = [asyncio.ensure_future(poller(transport, stop, counts))]
+    tasks += [asyncio.ensure_future(gui(transport, stop, counts)) for i in range(args.gui_tasks)]
+    await asyncio.sleep(args.time)
+    stop.set()
+    await asyncio.gather(*tasks)
+    wall, cpu = time.perf_counter() - wall, time.process_time() - cpu
+    errors = await check_wait(transport, server)
+    errors += await check_race(transport)
+    await transport.close()
+    server.shutdown()
+    return counts, cpu / wall * 100, errors
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Stress asyncio OpenOCD client with concurrent traffic")
+    parser.add_argument("-t", "--time", type=float, default=3, help="stress time per transport, s")
+    parser.add_argument("--gui-tasks", type=int, default=2, help="number of GUI-like tasks")
+    parser.add_argument("--delay", type=float, default=2, help="stand-in server delay per packet, ms")
+    parser.add_argument("--max-cpu", type=float, default=50, help="allowed CPU use, %% of one core")
+    args = parser.parse_args()
+
+    failed = False
+    for name, transport_class, handler in (("telnet", AsyncOpenOCDTelnet, TelnetHandler),
+                                           ("tcl rpc", AsyncOpenOCDTclRpc, TclRpcHandler)):
+        counts, cpu_use, errors = asyncio.run(stress(transport_class, handler, args))
+        errors += ["CPU use %.0f%% > %.0f%%" % (cpu_use, args.max_cpu)] if cpu_use > args.max_cpu else []
+        failed = failed or bool(errors)
+        print("%-8s %5d polls %6d GUI batches  CPU %5.1f%%  %s" % (name, counts["poller"], counts["gui"], cpu_use,
+                                                                 "; ".join(errors) if errors else "OK"))
+    sys.exit(1 if failed else 0)